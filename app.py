@@ -1,37 +1,81 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from config import TOKEN, PERMISSIONS, save_permissions, ROLE_MANAGERS, ROLE_ADMINS
+from config import (
+    TOKEN, PERMISSIONS, METRICS_HOST, METRICS_PORT, SHARD_COUNT, SHARD_IDS, CLUSTER_ID, CLUSTER_SOCKET, MEMBER_CACHE_SIZE,
+    AUDIT_STORE, flush_permissions
+)
 from commands.role_commands import role_group, logger as role_logger
-from utils.logger import Logger
-from utils.permissions import add_permission, has_permission
+from utils.logger import Logger, webhook_pool
+from utils.permissions import (
+    permission_transaction, has_permission, render_permission_report, claim_legacy_roles, invalidate_guild,
+    hierarchy_closure, who_has, render_who_has, export_holders, split_command
+)
+from utils.cluster import cluster_link
+from utils.member_cache import member_cache
+from utils.scheduler import request_scheduler, PRIORITY_NAMES
+from utils.role_search import role_search
+from utils.role_resolver import role_resolver
+from utils.command_catalog import command_catalog
+from utils.metrics import metrics
+from utils.persistence import dump_json
+import io
 import json
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-bot = commands.Bot(command_prefix="~", intents=intents)
+
+class MiniAceBot(commands.AutoShardedBot):
+    async def setup_hook(self):
+        if METRICS_PORT:
+            await metrics.start_http_server(METRICS_HOST, METRICS_PORT)
+        if CLUSTER_SOCKET:
+            cluster_link.on("invalidate", lambda message: invalidate_guild(message.get("guild")))
+            # Anything published while we were not connected was missed
+            cluster_link.on_connect(invalidate_guild)
+            await cluster_link.start(CLUSTER_SOCKET, CLUSTER_ID)
+
+    async def close(self):
+        # Deliver queued audit log embeds while the connection is still open
+        await logger.flush()
+        await role_logger.flush()
+        await AUDIT_STORE.aflush()
+        await cluster_link.close()
+        await super().close()
+
+# Without SHARD_COUNT, discord.py picks the shard count and runs every shard here.
+# cluster.py sets SHARD_COUNT and SHARD_IDS so that each process runs its own range.
+member_cache_options = {}
+if MEMBER_CACHE_SIZE:
+    # Low-memory mode: utils.member_cache keeps the recently active members instead
+    member_cache_options = {"member_cache_flags": discord.MemberCacheFlags.none(), "chunk_guilds_at_startup": False}
+bot = MiniAceBot(
+    command_prefix="~", intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS, **member_cache_options
+)
+request_scheduler.install(bot)
 logger = Logger()
 
 @bot.event
 async def on_ready():
     try:
-        await bot.tree.sync()
+        # Commands are global; in a cluster only the first process syncs them
+        if CLUSTER_ID == 0:
+            await bot.tree.sync()
         bot.synced = True
+        command_catalog.refresh(bot.tree)
         print(f"Commands synced successfully. Registered commands: {[cmd.name for cmd in bot.tree.get_commands()]}")
         
         # Automatically grant the guild owner the * permission
         for guild in bot.guilds:
             owner_id = guild.owner_id
             guild_id = guild.id
-            if guild_id not in PERMISSIONS:
-                PERMISSIONS[guild_id] = {}
-            if owner_id not in PERMISSIONS[guild_id]:
-                PERMISSIONS[guild_id][owner_id] = {}
-            if "*" not in PERMISSIONS[guild_id][owner_id]:
-                PERMISSIONS[guild_id][owner_id]["*"] = ["*"]
-                save_permissions()
-                print(f"Granted * permission to the owner of guild {guild.name} ({guild.id}).")
+            async with permission_transaction(guild_id) as txn:
+                if "*" not in PERMISSIONS.get(guild_id, {}).get(owner_id, {}):
+                    txn.grant(owner_id, "*", "*")
+                    print(f"Granted * permission to the owner of guild {guild.name} ({guild.id}).")
+            await claim_legacy_roles(guild)
+        await logger.claim_legacy_channel(bot)
     except Exception as e:
         print(f"Error syncing commands or granting owner permissions: {e}")
 
@@ -41,17 +85,60 @@ async def on_guild_join(guild: discord.Guild):
     try:
         owner_id = guild.owner_id
         guild_id = guild.id
-        if guild_id not in PERMISSIONS:
-            PERMISSIONS[guild_id] = {}
-        if owner_id not in PERMISSIONS[guild_id]:
-            PERMISSIONS[guild_id][owner_id] = {}
-        if "*" not in PERMISSIONS[guild_id][owner_id]:
-            PERMISSIONS[guild_id][owner_id]["*"] = ["*"]
-            save_permissions()
-            print(f"Granted * permission to the owner of new guild {guild.name} ({guild.id}).")
+        async with permission_transaction(guild_id) as txn:
+            if "*" not in PERMISSIONS.get(guild_id, {}).get(owner_id, {}):
+                txn.grant(owner_id, "*", "*")
+                print(f"Granted * permission to the owner of new guild {guild.name} ({guild.id}).")
+        await claim_legacy_roles(guild)
     except Exception as e:
         print(f"Error granting owner permissions for new guild {guild.name} ({guild.id}): {e}")
 
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    role_search.forget_guild(guild.id)
+    role_resolver.forget_guild(guild.id)
+    hierarchy_closure.forget_guild(guild.id)
+    member_cache.forget_guild(guild.id)
+
+@bot.event
+async def on_guild_available(guild: discord.Guild):
+    # Role events may have been missed while the guild was unavailable
+    role_resolver.forget_guild(guild.id)
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    await logger.forget_channel(channel)
+
+@bot.event
+async def on_webhooks_update(channel: discord.abc.GuildChannel):
+    webhook_pool.forget(channel.id)
+
+@bot.event
+async def on_interaction(interaction: discord.Interaction):
+    member_cache.remember(interaction.user)
+
+@bot.event
+async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+    member_cache.forget(payload.guild_id, payload.user.id)
+
+@bot.event
+async def on_guild_role_create(role: discord.Role):
+    role_search.on_role_create(role)
+    role_resolver.on_role_create(role)
+    hierarchy_closure.on_role_create(role)
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    role_search.on_role_update(before, after)
+    role_resolver.on_role_update(before, after)
+    hierarchy_closure.on_role_update(before, after)
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    role_search.on_role_delete(role)
+    role_resolver.on_role_delete(role)
+    hierarchy_closure.on_role_delete(role)
+
 @bot.tree.command(name="setlogchannel", description="Set the logging output channel.")
 async def set_log_channel(interaction: discord.Interaction):
     if not has_permission(interaction, "setlogchannel"):
@@ -59,8 +146,8 @@ async def set_log_channel(interaction: discord.Interaction):
         return
 
     await interaction.response.defer(ephemeral=True)
-    logger.set_channel(interaction.channel)
-    role_logger.set_channel(interaction.channel)
+    # Both loggers read the guild's setting
+    await logger.set_channel(interaction.channel)
 
     await interaction.followup.send(f"Aight, logging channel is now {interaction.channel.mention}. Keep it real.", ephemeral=True)
 
@@ -79,21 +166,8 @@ async def test_log(interaction: discord.Interaction):
     await interaction.followup.send("Logs tested, all good in the hood.", ephemeral=True)
 
 async def command_autocomplete(interaction: discord.Interaction, current: str):
-    bot_commands = [
-        app_commands.Choice(name=cmd.name, value=cmd.name)
-        for cmd in bot.tree.get_commands() if current.lower() in cmd.name.lower()
-    ]
-
-    discord_permissions = [
-        app_commands.Choice(name=perm, value=perm)
-        for perm in discord.Permissions.VALID_FLAGS if current.lower() in perm.lower()
-    ]
-
-
-    wildcard_option = [app_commands.Choice(name="*", value="*")]
-
-    combined_choices = bot_commands + discord_permissions + wildcard_option
-    return combined_choices[:25]
+    command_catalog.ensure(bot.tree)
+    return command_catalog.search(current)
 
 @bot.tree.command(name="perms", description="Manage permissions.")
 @app_commands.describe(
@@ -108,17 +182,26 @@ async def manage_permissions(interaction: discord.Interaction, action: str, targ
         await interaction.response.send_message("Yo, you ain't got the authority to mess with permissions, dawg.", ephemeral=True)
         return
 
+    # Target lookups and role edits below may call the API; answer within the deadline first
+    await interaction.response.defer(ephemeral=True)
+
     await logger.log_perms_command(bot, interaction, action, target, command, subcommand)
 
-    available_commands = [cmd.name for cmd in bot.tree.get_commands()]
-    available_permissions = list(discord.Permissions.VALID_FLAGS)
-    if command != "*" and command not in available_commands and command not in available_permissions and not command.startswith("role "):
-        await interaction.response.send_message(
+    command_catalog.ensure(bot.tree)
+    if command not in command_catalog and not command.startswith("role "):
+        await interaction.followup.send(
             f"Yo, I don't know what '{command}' is. Check your list, playa.", 
             ephemeral=True
         )
         return
 
+    try:
+        # Grants are stored per command and subcommand, not as "role create"
+        command, subcommand = split_command(command, subcommand)
+    except ValueError as e:
+        await interaction.followup.send(str(e), ephemeral=True)
+        return
+
     try:
         if target.startswith("<@&") and target.endswith(">"):
             target_id = int(target[3:-1])
@@ -128,20 +211,22 @@ async def manage_permissions(interaction: discord.Interaction, action: str, targ
             target_type = "user"
         else:
             target_id = int(target)
-            target_type = "user" if interaction.guild.get_member(target_id) else "role"
+            if member_cache.get(interaction.guild, target_id):
+                target_type = "user"
+            elif interaction.guild.get_role(target_id) or not MEMBER_CACHE_SIZE:
+                # With the full member cache an uncached ID is not a member
+                target_type = "role"
+            else:
+                target_type = "user" if await member_cache.fetch(interaction.guild, target_id) else "role"
     except ValueError:
-        await interaction.response.send_message("Invalid target format. Use a mention or ID.", ephemeral=True)
+        await interaction.followup.send("Invalid target format. Use a mention or ID.", ephemeral=True)
         return
 
     guild_id = interaction.guild.id
     if action == "add":
         if command == "*":
-            if guild_id not in PERMISSIONS:
-                PERMISSIONS[guild_id] = {}
-            if target_id not in PERMISSIONS[guild_id]:
-                PERMISSIONS[guild_id][target_id] = {}
-            PERMISSIONS[guild_id][target_id]["*"] = ["*"]
-            save_permissions()
+            async with permission_transaction(guild_id) as txn:
+                txn.grant(target_id, "*", "*")
 
             try:
                 if target_type == "role":
@@ -149,84 +234,70 @@ async def manage_permissions(interaction: discord.Interaction, action: str, targ
                     if role:
                         await role.edit(permissions=discord.Permissions(administrator=True))
                 elif target_type == "user":
-                    member = interaction.guild.get_member(target_id)
+                    member = await member_cache.fetch(interaction.guild, target_id)
                     if member:
                         admin_role = discord.utils.get(interaction.guild.roles, name="Administrator")
                         if not admin_role:
                             admin_role = await interaction.guild.create_role(name="Administrator", permissions=discord.Permissions(administrator=True))
                         await member.add_roles(admin_role)
             except discord.Forbidden:
-                await interaction.response.send_message(
+                await interaction.followup.send(
                     "I do not have sufficient permissions to grant Administrator access. Please ensure my role is higher in the role hierarchy and has the necessary permissions.",
                     ephemeral=True
                 )
                 return
 
-            await interaction.response.send_message(f"Master Access granted to {target}.", ephemeral=True)
+            await interaction.followup.send(f"Master Access granted to {target}.", ephemeral=True)
         else:
-            add_permission(guild_id, target_id, command, subcommand)
-            save_permissions()
-            await interaction.response.send_message(f"Aight, {target} now got access to {command} {subcommand or ''}.", ephemeral=True)
+            async with permission_transaction(guild_id) as txn:
+                txn.grant(target_id, command, subcommand)
+            await interaction.followup.send(f"Aight, {target} now got access to {command} {subcommand or ''}.", ephemeral=True)
     elif action == "remove":
         if command == "*":
-            if guild_id in PERMISSIONS and target_id in PERMISSIONS[guild_id]:
-                if "*" in PERMISSIONS[guild_id][target_id]:
-                    del PERMISSIONS[guild_id][target_id]["*"]
-                    if not PERMISSIONS[guild_id][target_id]:
-                        del PERMISSIONS[guild_id][target_id]
-                    save_permissions()
-
-                    try:
-                        if target_type == "role":
-                            role = interaction.guild.get_role(target_id)
-                            if role:
-                                await role.edit(permissions=discord.Permissions.none())
-                        elif target_type == "user":
-                            member = interaction.guild.get_member(target_id)
-                            if member:
-                                admin_role = discord.utils.get(interaction.guild.roles, name="Administrator")
-                                if admin_role:
-                                    await member.remove_roles(admin_role)
-                    except discord.Forbidden:
-                        await interaction.response.send_message(
-                            "I do not have sufficient permissions to revoke Administrator access. Please ensure my role is higher in the role hierarchy and has the necessary permissions.",
-                            ephemeral=True
-                        )
-                        return
-
-                    await interaction.response.send_message(f"Master Access revoked from {target}.", ephemeral=True)
-                    return
-            await interaction.response.send_message("Master Access not found for the target.", ephemeral=True)
+            # Check and revoke under the guild's lock; Discord edits happen after it is released
+            async with permission_transaction(guild_id) as txn:
+                if "*" in PERMISSIONS.get(guild_id, {}).get(target_id, {}):
+                    txn.revoke(target_id, "*")
+            if not txn.applied:
+                await interaction.followup.send("Master Access not found for the target.", ephemeral=True)
+                return
+
+            try:
+                if target_type == "role":
+                    role = interaction.guild.get_role(target_id)
+                    if role:
+                        await role.edit(permissions=discord.Permissions.none())
+                elif target_type == "user":
+                    member = await member_cache.fetch(interaction.guild, target_id)
+                    if member:
+                        admin_role = discord.utils.get(interaction.guild.roles, name="Administrator")
+                        if admin_role:
+                            await member.remove_roles(admin_role)
+            except discord.Forbidden:
+                await interaction.followup.send(
+                    "I do not have sufficient permissions to revoke Administrator access. Please ensure my role is higher in the role hierarchy and has the necessary permissions.",
+                    ephemeral=True
+                )
+                return
+
+            await interaction.followup.send(f"Master Access revoked from {target}.", ephemeral=True)
         else:
-            if guild_id in PERMISSIONS and target_id in PERMISSIONS[guild_id]:
-                if command in PERMISSIONS[guild_id][target_id]:
-                    if subcommand:
-                        if subcommand in PERMISSIONS[guild_id][target_id][command]:
-                            PERMISSIONS[guild_id][target_id][command].remove(subcommand)
-                            if not PERMISSIONS[guild_id][target_id][command]:
-                                del PERMISSIONS[guild_id][target_id][command]
-                            save_permissions()
-                            await interaction.response.send_message(
-                                f"Permission removed for {target} on {command} {subcommand}.", ephemeral=True
-                            )
-                            return
-                        else:
-                            await interaction.response.send_message(
-                                f"Subcommand '{subcommand}' not found for {command}.", ephemeral=True
-                            )
-                            return
-                    else:
-                        del PERMISSIONS[guild_id][target_id][command]
-                        if not PERMISSIONS[guild_id][target_id]:
-                            del PERMISSIONS[guild_id][target_id]
-                        save_permissions()
-                        await interaction.response.send_message(
-                            f"Permission removed for {target} on {command}.", ephemeral=True
-                        )
-                        return
-            await interaction.response.send_message("Permission not found.", ephemeral=True)
+            async with permission_transaction(guild_id) as txn:
+                granted = PERMISSIONS.get(guild_id, {}).get(target_id, {})
+                if command in granted:
+                    txn.revoke(target_id, command, subcommand)
+            if txn.applied:
+                await interaction.followup.send(
+                    f"Permission removed for {target} on {command}{' ' + subcommand if subcommand else ''}.", ephemeral=True
+                )
+            elif command in granted and subcommand:
+                await interaction.followup.send(
+                    f"Subcommand '{subcommand}' not found for {command}.", ephemeral=True
+                )
+            else:
+                await interaction.followup.send("Permission not found.", ephemeral=True)
     else:
-        await interaction.response.send_message("Yo, pick 'add' or 'remove', don't be special.", ephemeral=True)
+        await interaction.followup.send("Yo, pick 'add' or 'remove', don't be special.", ephemeral=True)
 
 @bot.tree.command(name="showperms", description="Output the current permissions to the console.")
 async def show_permissions(interaction: discord.Interaction):
@@ -240,62 +311,129 @@ async def check_permissions(interaction: discord.Interaction):
     if not has_permission(interaction, "checkperms"):
         await interaction.response.send_message("Nah, you ain't allowed to check your permissions, playa.", ephemeral=True)
         return
-    user_id = interaction.user.id
-    role_ids = [role.id for role in interaction.user.roles]
-    guild_id = interaction.guild.id
+    response = render_permission_report(interaction.guild, interaction.user)
+    if response is None:
+        await interaction.response.send_message("Yo, you ain't got no special permissions. Step it up.", ephemeral=True)
+        return
 
-    user_perms = {}
-    role_manager_roles = []
-    role_admin_roles = []
+    await interaction.response.send_message(response, ephemeral=False)
 
-    if guild_id in PERMISSIONS:
-        if user_id in PERMISSIONS[guild_id]:
-            user_perms["User"] = PERMISSIONS[guild_id][user_id]
-        for role_id in role_ids:
-            if role_id in PERMISSIONS[guild_id]:
-                user_perms[f"Role {role_id}"] = PERMISSIONS[guild_id][role_id]
+@bot.tree.command(name="whohas", description="List everyone who can run a command.")
+@app_commands.describe(
+    command="Command to look up (use '*' for Master Access)",
+    subcommand="Subcommand or role (optional)",
+    page="Page of results (optional)",
+    export="Attach the guild's whole permission index as JSON (optional)"
+)
+@app_commands.autocomplete(command=command_autocomplete)
+async def who_has_command(interaction: discord.Interaction, command: str, subcommand: str = None, page: int = 1, export: bool = False):
+    if not has_permission(interaction, "whohas"):
+        await interaction.response.send_message("You ain't got the clearance to see who holds what, homie.", ephemeral=True)
+        return
 
-    for role_id, managers in ROLE_MANAGERS.items():
-        if user_id in managers:
-            role_manager_roles.append(role_id)
+    if export:
+        document = io.BytesIO(dump_json(export_holders(interaction.guild.id)))
+        await interaction.response.send_message(
+            "Here's the full permission index for this guild.",
+            file=discord.File(document, filename=f"whohas-{interaction.guild.id}.json"),
+            ephemeral=True
+        )
+        return
 
-    for role_id, admins in ROLE_ADMINS.items():
-        if user_id in admins:
-            role_admin_roles.append(role_id)
+    try:
+        command, subcommand = split_command(command, subcommand)
+    except ValueError as e:
+        await interaction.response.send_message(str(e), ephemeral=True)
+        return
 
-    if not user_perms and not role_manager_roles and not role_admin_roles:
-        await interaction.response.send_message("Yo, you ain't got no special permissions. Step it up.", ephemeral=True)
+    entries = who_has(interaction.guild, command, subcommand)
+    response = render_who_has(interaction.guild, command, subcommand, entries, page)
+    if response is None:
+        await interaction.response.send_message("That page doesn't exist, playa.", ephemeral=True)
         return
+    await interaction.response.send_message(response, ephemeral=True, allowed_mentions=discord.AllowedMentions.none())
 
-    response = "**Your Permissions**\n"
-    if user_perms:
-        response += "**General Permissions:**\n"
-        for key, perms in user_perms.items():
-            response += f"- **{key}:**\n"
-            for command, subcommands in perms.items():
-                subcommands_list = ", ".join(subcommands) if subcommands else "None"
-                response += f"  - `{command}`: {subcommands_list}\n"
-
-    if role_manager_roles:
-        response += "\n**Role Manager For:**\n"
-        for role_id in role_manager_roles:
-            role = interaction.guild.get_role(role_id)
-            response += f"- {role.mention if role else f'Role ID: {role_id}'}\n"
-
-    if role_admin_roles:
-        response += "\n**Role Admin For:**\n"
-        for role_id in role_admin_roles:
-            role = interaction.guild.get_role(role_id)
-            response += f"- {role.mention if role else f'Role ID: {role_id}'}\n"
+AUDIT_PAGE_SIZE = 10
 
-    await interaction.response.send_message(response, ephemeral=False)
+@bot.tree.command(name="auditlog", description="Search the audit log.")
+@app_commands.describe(
+    user="Only actions performed by this user (optional)",
+    target="Only actions on this user or role, mention or ID (optional)",
+    action="Only this action, e.g. Assign or Perms add (optional)",
+    page="Page of results (optional)"
+)
+async def audit_log(interaction: discord.Interaction, user: discord.User = None, target: str = None, action: str = None, page: int = 1):
+    if not has_permission(interaction, "auditlog"):
+        await interaction.response.send_message("You ain't got the clearance to dig through the audit log, homie.", ephemeral=True)
+        return
+
+    target_id = None
+    if target:
+        stripped = target.strip("<@!&>")
+        if not stripped.isdigit():
+            await interaction.response.send_message("Invalid target format. Use a mention or ID.", ephemeral=True)
+            return
+        target_id = int(stripped)
+
+    page = max(page, 1)
+    entries, total = await AUDIT_STORE.query(
+        interaction.guild.id, actor_id=user.id if user else None, target_id=target_id, action=action,
+        limit=AUDIT_PAGE_SIZE, offset=(page - 1) * AUDIT_PAGE_SIZE
+    )
+    if not entries:
+        await interaction.response.send_message("No audit entries match that, boss." if page == 1 else "That page doesn't exist, playa.", ephemeral=True)
+        return
+
+    pages = -(-total // AUDIT_PAGE_SIZE)
+    lines = [f"**Audit log** ({total} entries, page {page}/{pages})"]
+    for entry in entries:
+        details = ", ".join(f"{key}: {value}" for key, value in entry["details"].items() if key != "User")
+        lines.append(f"<t:{int(entry['at'])}:f> <@{entry['actor_id']}> **{entry['action']}** {details}"[:190])
+    await interaction.response.send_message("\n".join(lines), ephemeral=True, allowed_mentions=discord.AllowedMentions.none())
+
+@bot.tree.command(name="botstats", description="Show command latency and throughput statistics.")
+async def bot_stats(interaction: discord.Interaction):
+    if not has_permission(interaction, "botstats"):
+        await interaction.response.send_message("You ain't got the clearance to see the stats, homie.", ephemeral=True)
+        return
+
+    def table(title, rows, label):
+        lines = [f"**{title}**", "```", f"{label:<32} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"]
+        for labels, count, p50, p95, p99 in rows[:15]:
+            name = " ".join(str(value) for value in labels.values())
+            lines.append(f"{name[:32]:<32} {count:>7} {p50 * 1000:>8.2f} {p95 * 1000:>8.2f} {p99 * 1000:>8.2f}")
+        lines.append("```")
+        return "\n".join(lines)
+
+    response = table("Commands", metrics.summary("command_seconds"), "command")
+    response += "\n" + table("Internals", metrics.summary("span_seconds"), "span")
+    response += "\n" + table("Request queue wait", metrics.summary("scheduler_wait_seconds"), "priority")
+    queued = ", ".join(f"{name} {request_scheduler.queue_depth(priority)}" for priority, name in PRIORITY_NAMES.items())
+    response += f"\n**Request queue**: {request_scheduler.in_flight} in flight, queued: {queued}"
+    stats = member_cache.stats()
+    if stats["capacity"]:
+        hit_rate = f"{stats['hit_rate']:.1%}" if stats["hit_rate"] is not None else "n/a"
+        response += (
+            f"\n**Member cache**: {stats['size']}/{stats['capacity']} members, hit rate {hit_rate}, "
+            f"{stats['fetches']} fetches, {stats['evictions']} evictions"
+        )
+    if stats["peak_rss_mb"] is not None:
+        response += f"\n**Peak memory**: {stats['peak_rss_mb']:.0f} MiB"
+    await interaction.response.send_message(response[:2000], ephemeral=True)
 
 bot.tree.add_command(role_group)
+metrics.instrument_tree(bot.tree)
 
 @bot.event
 async def on_connect():
     if not hasattr(bot, "synced"):
-        await bot.tree.sync()
+        if CLUSTER_ID == 0:
+            await bot.tree.sync()
         bot.synced = True
+        command_catalog.refresh(bot.tree)
 
-bot.run(TOKEN)
+try:
+    bot.run(TOKEN)
+finally:
+    flush_permissions()
+    AUDIT_STORE.close()
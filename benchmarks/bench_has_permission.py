@@ -0,0 +1,104 @@
+"""
+Micro-benchmark: compiled has_permission vs. the previous list-scanning version.
+
+Run from the repository root:
+    python benchmarks/bench_has_permission.py
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DISCORD_TOKEN", "benchmark-token")
+
+# config resolves its data files relative to the working directory; keep the
+# benchmark away from the real permissions.json.
+_workdir = tempfile.mkdtemp(prefix="miniace-bench-")
+os.chdir(_workdir)
+atexit.register(shutil.rmtree, _workdir, ignore_errors=True)
+
+from config import PERMISSIONS  # noqa: E402
+from utils.permissions import has_permission, permission_index  # noqa: E402
+
+GUILD_ID = 1
+ROLES_IN_GUILD = 250
+ROLES_PER_MEMBER = 40
+SUBCOMMANDS_PER_ROLE = 50
+
+
+def legacy_has_permission(interaction, command, subcommand=None):
+    guild_id = interaction.guild.id
+    user_id = interaction.user.id
+    role_ids = [role.id for role in interaction.user.roles]
+
+    command = command.lower()
+    if subcommand and subcommand.startswith("<@&") and subcommand.endswith(">"):
+        try:
+            subcommand = str(int(subcommand[3:-1]))
+        except ValueError:
+            subcommand = None
+    subcommand = subcommand.lower() if subcommand else None
+
+    if guild_id in PERMISSIONS:
+        if user_id in PERMISSIONS[guild_id] and "*" in PERMISSIONS[guild_id][user_id]:
+            return True
+
+        for role_id in role_ids:
+            if role_id in PERMISSIONS[guild_id] and "*" in PERMISSIONS[guild_id][role_id]:
+                return True
+
+        if user_id in PERMISSIONS[guild_id]:
+            user_permissions = PERMISSIONS[guild_id][user_id]
+            if command in user_permissions:
+                if not subcommand or subcommand in [sc.lower() for sc in user_permissions[command]]:
+                    return True
+
+        for role_id in role_ids:
+            if role_id in PERMISSIONS[guild_id]:
+                role_permissions = PERMISSIONS[guild_id][role_id]
+                if command in role_permissions:
+                    if not subcommand or subcommand in [sc.lower() for sc in role_permissions[command]]:
+                        return True
+
+    return False
+
+
+def build_state():
+    PERMISSIONS.clear()
+    PERMISSIONS[GUILD_ID] = {
+        role_id: {"role": [str(1000 + role_id * SUBCOMMANDS_PER_ROLE + i) for i in range(SUBCOMMANDS_PER_ROLE)]}
+        for role_id in range(100, 100 + ROLES_IN_GUILD)
+    }
+    permission_index.rebuild()
+
+    roles = [SimpleNamespace(id=role_id) for role_id in range(100, 100 + ROLES_PER_MEMBER)]
+    user = SimpleNamespace(id=42, roles=roles)
+    return SimpleNamespace(guild=SimpleNamespace(id=GUILD_ID), user=user)
+
+
+def main():
+    interaction = build_state()
+    cases = {
+        "miss (unknown subcommand)": ("role", "create"),
+        "hit (last held role)": ("role", str(1000 + (100 + ROLES_PER_MEMBER - 1) * SUBCOMMANDS_PER_ROLE)),
+        "miss (unknown command)": ("perms", None),
+    }
+
+    number = 2000
+    for label, args in cases.items():
+        assert legacy_has_permission(interaction, *args) == has_permission(interaction, *args)
+        legacy = min(timeit.repeat(lambda: legacy_has_permission(interaction, *args), number=number, repeat=5))
+        compiled = min(timeit.repeat(lambda: has_permission(interaction, *args), number=number, repeat=5))
+        print(
+            f"{label:<28} legacy {legacy / number * 1e6:9.2f} us  "
+            f"compiled {compiled / number * 1e6:7.2f} us  "
+            f"speedup {legacy / compiled:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
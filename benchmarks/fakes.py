@@ -0,0 +1,94 @@
+"""
+Lightweight stand-ins for the discord.py objects the bot touches, so hot
+paths can be exercised without a gateway connection.
+"""
+
+
+class FakeRole:
+    def __init__(self, guild, role_id, name, position):
+        self.guild = guild
+        self.id = role_id
+        self.name = name
+        self.position = position
+
+    @property
+    def mention(self):
+        return f"<@&{self.id}>"
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRole) and other.id == self.id
+
+    def __hash__(self):
+        return self.id >> 22
+
+    def __repr__(self):
+        return f"<FakeRole id={self.id} name={self.name!r}>"
+
+
+class FakeMember:
+    def __init__(self, guild, member_id, roles=()):
+        self.guild = guild
+        self.id = member_id
+        self.name = f"member{member_id}"
+        self.roles = [guild.default_role, *roles]
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    @property
+    def top_role(self):
+        return max(self.roles, key=lambda role: role.position)
+
+    def __str__(self):
+        return self.name
+
+
+class FakeGuild:
+    def __init__(self, guild_id, role_names=()):
+        self.id = guild_id
+        self.owner_id = guild_id + 1
+        self._roles = {}
+        self.default_role = self._add_role(guild_id, "@everyone", 0)
+        for position, name in enumerate(role_names, start=1):
+            self._add_role(guild_id * 1000 + position, name, position)
+        self._members = {}
+
+    def _add_role(self, role_id, name, position):
+        role = FakeRole(self, role_id, name, position)
+        self._roles[role_id] = role
+        return role
+
+    @property
+    def roles(self):
+        return sorted(self._roles.values(), key=lambda role: role.position)
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    def add_member(self, member_id, roles=()):
+        member = self._members[member_id] = FakeMember(self, member_id, roles)
+        return member
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+
+class FakeResponse:
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, content=None, **kwargs):
+        self.messages.append(content)
+
+    async def defer(self, **kwargs):
+        pass
+
+
+class FakeInteraction:
+    def __init__(self, guild, user, client=None):
+        self.guild = guild
+        self.user = user
+        self.client = client
+        self.channel = None
+        self.response = FakeResponse()
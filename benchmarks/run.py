@@ -0,0 +1,371 @@
+"""
+Offline benchmark suite for the bot's hot paths.
+
+Builds synthetic state (by default 1k guilds x 250 roles, 100k grants,
+10k role managers) with fake discord objects and times each path. Results
+are printed as JSON so runs can be stored and compared across versions.
+
+Run from the repository root:
+    python benchmarks/run.py --output bench.json
+    python benchmarks/run.py --quick --compare bench.json
+"""
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DISCORD_TOKEN", "benchmark-token")
+
+# config resolves its data files relative to the working directory; keep the
+# benchmark away from the real permissions.json.
+_workdir = tempfile.mkdtemp(prefix="miniace-bench-")
+os.chdir(_workdir)
+atexit.register(shutil.rmtree, _workdir, ignore_errors=True)
+
+import discord  # noqa: E402
+from discord import app_commands  # noqa: E402
+
+import config  # noqa: E402
+from benchmarks.fakes import FakeInteraction  # noqa: E402
+from benchmarks.synthetic import generate_guilds, generate_member, generate_state, to_json_document  # noqa: E402
+from commands.role_commands import role_group  # noqa: E402
+from storage.audit_store import AuditStore  # noqa: E402
+from storage.json_store import JsonStore  # noqa: E402
+from storage.sharded_store import ShardedJsonStore  # noqa: E402
+from storage.sqlite_store import SqliteStore  # noqa: E402
+from utils.autocomplete import role_autocomplete  # noqa: E402
+from utils.command_catalog import CommandCatalog  # noqa: E402
+from utils.role_resolver import role_resolver  # noqa: E402
+from utils.permissions import (  # noqa: E402
+    can_manage_role, export_holders, has_permission, hierarchy_closure, permission_index, render_permission_report, who_has
+)
+
+
+def measure(name, func, iterations, repeat=5, calls=1):
+    """Time `func`, which performs `calls` operations, and report per-operation microseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        samples.append((time.perf_counter() - start) / (iterations * calls))
+    samples.sort()
+    return {
+        "name": name,
+        "operations": iterations * repeat * calls,
+        "min_us": samples[0] * 1e6,
+        "median_us": samples[len(samples) // 2] * 1e6,
+        "max_us": samples[-1] * 1e6,
+    }
+
+
+def load_state(permissions, managers, admins):
+    config.PERMISSIONS.clear()
+    config.PERMISSIONS.update(permissions)
+    for index, entries in ((config.ROLE_MANAGERS, managers), (config.ROLE_ADMINS, admins)):
+        index.clear()
+        for guild_id, roles in entries.items():
+            for role_id, users in roles.items():
+                for user_id in users:
+                    index.add(guild_id, role_id, user_id)
+    permission_index.rebuild()
+    hierarchy_closure.rebuild()
+
+
+COLD_START_SCRIPT = """
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import config
+imported = time.perf_counter()
+config.PERMISSIONS.get({guild_id})
+config.ROLE_MANAGERS.contains({guild_id}, 0, 0)
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def measure_cold_start(document, backend, db_path=None, shard_dir=None, repeat=3):
+    """Import config in a fresh interpreter, then time the first permission lookup."""
+    workdir = tempfile.mkdtemp(dir=_workdir)
+    if shard_dir:
+        shutil.copytree(shard_dir, os.path.join(workdir, "permissions"))
+    else:
+        with open(os.path.join(workdir, "permissions.json"), "w") as f:
+            json.dump(document, f)
+    if db_path:
+        shutil.copy(db_path, os.path.join(workdir, "permissions.db"))
+    env = dict(os.environ, PERMISSIONS_BACKEND=backend, PERMISSIONS_DB="permissions.db", PERMISSIONS_DIR="permissions")
+    script = COLD_START_SCRIPT.format(root=ROOT, guild_id=int(next(iter(document["permissions"]), 0)))
+
+    imports, first_access = [], []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=workdir, env=env, text=True)
+        import_seconds, access_seconds = map(float, output.strip().splitlines()[-1].split())
+        imports.append(import_seconds)
+        first_access.append(access_seconds)
+
+    results = []
+    for name, samples in ((f"config_import_{backend}", imports), (f"first_lookup_{backend}", first_access)):
+        samples.sort()
+        results.append({
+            "name": name,
+            "operations": repeat,
+            "min_us": samples[0] * 1e6,
+            "median_us": samples[len(samples) // 2] * 1e6,
+            "max_us": samples[-1] * 1e6,
+        })
+    return results
+
+
+def build_tree():
+    tree = app_commands.CommandTree(discord.Client(intents=discord.Intents.default()))
+    tree.add_command(role_group)
+    for name in ("perms", "checkperms", "showperms", "setlogchannel", "testlog", "botstats", "whohas", "auditlog"):
+        async def callback(interaction: discord.Interaction):
+            pass
+        tree.command(name=name, description=name)(callback)
+    return tree
+
+
+def run(args):
+    rng = random.Random(4)
+    results = []
+
+    started = time.perf_counter()
+    guilds = generate_guilds(args.guilds, args.roles)
+    permissions, managers, admins = generate_state(guilds, args.grants, args.managers)
+    load_state(permissions, managers, admins)
+    print(f"Generated synthetic state in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    interactions = [
+        FakeInteraction(guild, generate_member(guild, min(30, args.roles - 1), seed=i))
+        for i, guild in enumerate(rng.sample(guilds, min(len(guilds), 200)))
+    ]
+    checks = [("role", "create"), ("role", "assign"), ("perms", None), ("checkperms", None), ("role", "nope")]
+
+    def bench_has_permission():
+        for interaction in interactions:
+            for command, subcommand in checks:
+                has_permission(interaction, command, subcommand)
+
+    results.append(measure("has_permission", bench_has_permission, 20, calls=len(interactions) * len(checks)))
+
+    def bench_hierarchy_check():
+        for interaction in interactions:
+            top_position = interaction.user.top_role.position
+            for command, subcommand in checks:
+                hierarchy_closure.check(interaction.guild, top_position, command, subcommand)
+
+    results.append(measure("hierarchy_check", bench_hierarchy_check, 20, calls=len(interactions) * len(checks)))
+
+    role_targets = [(interaction, rng.choice(interaction.guild.roles).id) for interaction in interactions]
+
+    def bench_can_manage_role():
+        for interaction, role_id in role_targets:
+            can_manage_role(interaction, role_id, action="assign")
+
+    results.append(measure("can_manage_role", bench_can_manage_role, 20, calls=len(role_targets)))
+
+    def bench_checkperms():
+        for interaction in interactions:
+            render_permission_report(interaction.guild, interaction.user)
+
+    results.append(measure("checkperms_render", bench_checkperms, 5, calls=len(interactions)))
+
+    def bench_who_has():
+        for interaction, role_id in role_targets:
+            who_has(interaction.guild, "role", "create")
+            who_has(interaction.guild, "role", str(role_id))
+
+    results.append(measure("who_has", bench_who_has, 5, calls=len(role_targets) * 2))
+    results.append(measure("export_holders", lambda: export_holders(rng.choice(guilds).id), 20))
+
+    # /role assign, unassign and delete arguments: 25 names (some quoted or differently cased), mentions and IDs
+    role_lists = []
+    for interaction in interactions:
+        picked = rng.sample(interaction.guild.roles[1:], 25)
+        tokens = [role.name.upper() for role in picked[:10]] + [f'"{role.name}"' for role in picked[10:15]]
+        tokens += [role.mention for role in picked[15:20]] + [str(role.id) for role in picked[20:]]
+        role_lists.append((interaction.guild, ", ".join(tokens)))
+    for guild, text in role_lists:
+        role_resolver.resolve(guild, text)
+
+    def bench_resolve_roles():
+        for guild, text in role_lists:
+            role_resolver.resolve(guild, text)
+
+    results.append(measure("resolve_role_list", bench_resolve_roles, 20, calls=len(role_lists)))
+
+    # Persistence and loading of the full state
+    document = to_json_document(permissions, managers, admins)
+    json_path = os.path.join(_workdir, "bench_permissions.json")
+    with open(json_path, "w") as f:
+        json.dump(document, f)
+
+    json_store = JsonStore(json_path)
+    json_store.load()
+
+    def bench_save_json():
+        json_store._writer._dirty = True
+        json_store.flush()
+
+    results.append(measure("save_permissions_json_full_write", bench_save_json, 1, repeat=3))
+    results.append(measure("config_load_json", lambda: JsonStore(json_path).load(), 1, repeat=3))
+
+    results.extend(measure_cold_start(document, "json"))
+
+    sqlite_path = os.path.join(_workdir, "bench_permissions.db")
+    sqlite_store = SqliteStore(sqlite_path, json_path=json_path)
+    results.append(measure("config_load_sqlite", sqlite_store.load, 1, repeat=3))
+    results.append(measure("load_guild_sqlite", lambda: sqlite_store.load_guild(rng.choice(guilds).id), 50))
+    grant_targets = iter(range(10**12, 10**13))
+    results.append(measure(
+        "save_permissions_sqlite_single_grant",
+        lambda: sqlite_store.grant(guilds[0].id, next(grant_targets), "role", "create"),
+        200
+    ))
+    sqlite_store.close()
+    results.extend(measure_cold_start(document, "sqlite", db_path=sqlite_path))
+
+    shard_dir = os.path.join(_workdir, "bench_permissions")
+    shutil.copy(json_path, json_path + ".legacy")
+    started = time.perf_counter()
+    sharded_store = ShardedJsonStore(shard_dir, legacy_path=json_path + ".legacy")
+    results.append({"name": "sharded_migration", "operations": 1, "min_us": 0, "median_us": (time.perf_counter() - started) * 1e6, "max_us": 0})
+    sharded_store.load()
+
+    def bench_save_sharded():
+        sharded_store.grant(rng.choice(guilds).id, 0, "role", "create")
+        sharded_store.flush()
+
+    results.append(measure("save_permissions_sharded_single_grant", bench_save_sharded, 50))
+    results.append(measure("sharded_compaction", lambda: sharded_store.compact(rng.choice(guilds).id), 20))
+    results.extend(measure_cold_start(document, "sharded", shard_dir=shard_dir))
+
+    # Autocomplete paths
+    loop = asyncio.new_event_loop()
+    queries = ["", "t", "te", "tea", "team", "mod c", "voice-1", "zz"]
+    autocomplete_calls = [(interaction, query) for interaction in interactions[:20] for query in queries]
+
+    async def autocomplete_batch():
+        for interaction, query in autocomplete_calls:
+            await role_autocomplete(interaction, query)
+
+    # First pass builds the per-guild indexes; time steady-state keystrokes
+    loop.run_until_complete(autocomplete_batch())
+    results.append(measure(
+        "role_autocomplete",
+        lambda: loop.run_until_complete(autocomplete_batch()),
+        5,
+        calls=len(autocomplete_calls)
+    ))
+
+    # Audit log: buffered inserts and filtered queries
+    audit_store = AuditStore(os.path.join(_workdir, "bench_audit.db"))
+    audit_batch = [
+        (interaction.guild.id, interaction.user.id, rng.choice(["Assign", "Unassign", "Create"]), role_id)
+        for interaction, role_id in role_targets
+    ]
+
+    async def record_audit_batch():
+        for guild_id, actor_id, action, target_id in audit_batch:
+            audit_store.record(guild_id, actor_id, action, target_id, RoleID=target_id)
+        await audit_store.aflush()
+
+    results.append(measure(
+        "audit_record", lambda: loop.run_until_complete(record_audit_batch()), 10, calls=len(audit_batch)
+    ))
+    results.append(measure(
+        "audit_query",
+        lambda: loop.run_until_complete(audit_store.query(rng.choice(audit_batch)[0], action="Assign", limit=10)),
+        50
+    ))
+    audit_store.close()
+
+    catalog = CommandCatalog()
+    catalog.refresh(build_tree())
+    prefixes = ["", "r", "ro", "role", "role a", "man", "manage_r", "zzz", "*"]
+
+    def bench_command_autocomplete():
+        catalog._cache.clear()
+        for query in prefixes:
+            catalog.search(query)
+
+    results.append(measure("command_autocomplete", bench_command_autocomplete, 200, calls=len(prefixes)))
+    loop.close()
+
+    return results
+
+
+def git_version():
+    try:
+        return subprocess.check_output(["git", "-C", ROOT, "describe", "--always", "--dirty"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current, baseline_path, threshold):
+    with open(baseline_path, "r") as f:
+        baseline = {result["name"]: result for result in json.load(f)["results"]}
+
+    regressions = []
+    for result in current["results"]:
+        previous = baseline.get(result["name"])
+        if not previous:
+            continue
+        ratio = result["median_us"] / previous["median_us"] if previous["median_us"] else 1.0
+        marker = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{result['name']:<40} {previous['median_us']:>12.2f} -> {result['median_us']:>12.2f} us  x{ratio:5.2f} {marker}", file=sys.stderr)
+        if marker:
+            regressions.append(result["name"])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--roles", type=int, default=250, help="roles per guild")
+    parser.add_argument("--grants", type=int, default=100_000)
+    parser.add_argument("--managers", type=int, default=10_000)
+    parser.add_argument("--quick", action="store_true", help="one tenth of the default scale")
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON results to compare medians against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before a result counts as a regression")
+    args = parser.parse_args()
+    if args.quick:
+        args.guilds //= 10
+        args.grants //= 10
+        args.managers //= 10
+
+    report = {
+        "version": git_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": {"guilds": args.guilds, "roles_per_guild": args.roles, "grants": args.grants, "role_managers": args.managers},
+        "results": run(args),
+    }
+
+    if args.output:
+        with open(os.path.join(ROOT, args.output) if not os.path.isabs(args.output) else args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        baseline = args.compare if os.path.isabs(args.compare) else os.path.join(ROOT, args.compare)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Generators for synthetic permission state at production-like scale."""
+import random
+
+from benchmarks.fakes import FakeGuild
+
+COMMANDS = ["role", "perms", "checkperms", "showperms", "setlogchannel", "testlog", "botstats", "whohas", "auditlog"]
+ROLE_SUBCOMMANDS = ["create", "delete", "edit", "assign", "unassign", "move", "bulk"]
+ROLE_WORDS = ["Team", "Mod", "Color", "Event", "Staff", "Helper", "Raid", "Guild", "Voice", "Artist", "Dev", "VIP"]
+
+
+def role_names(rng, count):
+    return [f"{rng.choice(ROLE_WORDS)} {rng.choice(ROLE_WORDS).lower()}-{i}" for i in range(count)]
+
+
+def generate_guilds(guild_count=1000, roles_per_guild=250, seed=1):
+    rng = random.Random(seed)
+    return [
+        FakeGuild((guild_id + 1) << 22, role_names(rng, roles_per_guild - 1))
+        for guild_id in range(guild_count)
+    ]
+
+
+def generate_state(guilds, grants=100_000, role_managers=10_000, role_admins=1_000, seed=2):
+    """
+    Return (permissions, role_managers, role_admins) in the in-memory shape
+    used by config: grants are spread across guilds, mostly on roles.
+    """
+    rng = random.Random(seed)
+    permissions = {}
+    managers = {}
+    admins = {}
+
+    for _ in range(grants):
+        guild = rng.choice(guilds)
+        if rng.random() < 0.8:
+            principal_id = rng.choice(guild.roles[1:]).id
+        else:
+            principal_id = guild.id + rng.randrange(10, 5000)
+        command = rng.choice(COMMANDS)
+        if command == "role":
+            subcommand = rng.choice(ROLE_SUBCOMMANDS + [str(rng.choice(guild.roles).id)])
+        else:
+            subcommand = None
+        commands = permissions.setdefault(guild.id, {}).setdefault(principal_id, {})
+        subcommands = commands.setdefault(command, [])
+        if subcommand and subcommand not in subcommands:
+            subcommands.append(subcommand)
+
+    for target, count in ((managers, role_managers), (admins, role_admins)):
+        for _ in range(count):
+            guild = rng.choice(guilds)
+            role_id = rng.choice(guild.roles[1:]).id
+            users = target.setdefault(guild.id, {}).setdefault(role_id, [])
+            user_id = guild.id + rng.randrange(10, 5000)
+            if user_id not in users:
+                users.append(user_id)
+
+    return permissions, managers, admins
+
+
+def generate_member(guild, roles_held=30, seed=3):
+    rng = random.Random(seed)
+    member_id = guild.id + rng.randrange(10, 5000)
+    return guild.get_member(member_id) or guild.add_member(member_id, rng.sample(guild.roles[1:], roles_held))
+
+
+def to_json_document(permissions, managers, admins):
+    """The permissions.json layout for the same state."""
+    return {
+        "permissions": {
+            str(guild_id): {
+                str(principal_id): commands for principal_id, commands in principals.items()
+            }
+            for guild_id, principals in permissions.items()
+        },
+        "role_managers": to_role_document(managers),
+        "role_admins": to_role_document(admins),
+    }
+
+
+def to_role_document(entries):
+    return {
+        str(guild_id): {str(role_id): [str(user_id) for user_id in users] for role_id, users in roles.items()}
+        for guild_id, roles in entries.items()
+    }
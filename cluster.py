@@ -0,0 +1,100 @@
+"""
+Run MiniAce as several bot processes, each owning a contiguous range of
+shards, with a Unix socket hub relaying cache invalidations between them.
+
+    python cluster.py --processes 4 --shards 16
+
+Every process runs app.py with SHARD_COUNT, SHARD_IDS, CLUSTER_ID and
+CLUSTER_SOCKET set. Processes that exit unexpectedly are restarted.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+from utils.cluster import ClusterHub
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+RESTART_DELAY = 5.0
+
+
+def shard_ranges(shard_count, processes):
+    """Split shard ids 0..shard_count-1 into `processes` contiguous, near-equal ranges."""
+    base, extra = divmod(shard_count, processes)
+    ranges, start = [], 0
+    for cluster_id in range(processes):
+        size = base + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+def child_env(cluster_id, shard_ids, shard_count, socket_path):
+    env = dict(
+        os.environ,
+        CLUSTER_ID=str(cluster_id),
+        CLUSTER_SOCKET=socket_path,
+        SHARD_COUNT=str(shard_count),
+        SHARD_IDS=",".join(map(str, shard_ids)),
+        BULK_JOBS_FILE=f"bulk_jobs.{cluster_id}.json",
+    )
+    if int(os.environ.get("METRICS_PORT", "0")):
+        env["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + cluster_id)
+    return env
+
+
+async def supervise(cluster_id, env, stopping):
+    while not stopping.is_set():
+        process = await asyncio.create_subprocess_exec(sys.executable, APP, env=env)
+        print(f"[cluster] process {cluster_id} started (pid {process.pid}, shards {env['SHARD_IDS']})")
+        waiter = asyncio.ensure_future(process.wait())
+        stopper = asyncio.ensure_future(stopping.wait())
+        await asyncio.wait({waiter, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        stopper.cancel()
+
+        if stopping.is_set():
+            if process.returncode is None:
+                process.terminate()
+                await waiter
+            return
+        print(f"[cluster] process {cluster_id} exited with {process.returncode}; restarting in {RESTART_DELAY:.0f}s")
+        await asyncio.sleep(RESTART_DELAY)
+
+
+async def run(args):
+    if args.shards < args.processes:
+        raise SystemExit("--shards must be at least --processes")
+
+    socket_path = args.socket or os.path.join(tempfile.gettempdir(), f"miniace-cluster-{os.getpid()}.sock")
+    hub = ClusterHub(socket_path)
+    await hub.start()
+    print(f"[cluster] hub listening on {socket_path}")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    try:
+        await asyncio.gather(*(
+            supervise(cluster_id, child_env(cluster_id, shard_ids, args.shards, socket_path), stopping)
+            for cluster_id, shard_ids in enumerate(shard_ranges(args.shards, args.processes))
+        ))
+    finally:
+        await hub.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=int(os.environ.get("CLUSTER_PROCESSES", "2")))
+    parser.add_argument("--shards", type=int, default=int(os.environ.get("SHARD_COUNT", "0")) or None,
+                        help="total shard count (default: one per process)")
+    parser.add_argument("--socket", help="path of the hub's Unix socket")
+    args = parser.parse_args()
+    args.shards = args.shards or args.processes
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
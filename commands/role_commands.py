@@ -1,14 +1,64 @@
+import asyncio
+import time
 import discord
 from discord import app_commands
-from utils.permissions import has_permission, user_has_permission, add_permission, add_role_manager, add_role_admin, is_role_admin, can_manage_role, remove_role_manager, remove_role_admin
+from utils.permissions import has_permission, user_has_permission, permission_transaction, is_role_admin, can_manage_role
 from utils.autocomplete import role_autocomplete
-from config import ALLOWED_ROLE_NAMES, ALLOWED_USER_IDS, save_permissions
+from utils.role_search import role_search
+from utils.role_resolver import role_resolver, UnresolvedRole
+from utils.bulk_roles import bulk_roles
+from utils.role_positions import plan_role_positions
+from utils.metrics import metrics
+from config import ALLOWED_ROLE_NAMES, ALLOWED_USER_IDS
 from utils.logger import Logger
 
 logger = Logger()
 
+# Role deletions in flight at once per /role delete
+DELETE_CONCURRENCY = 4
+# Seconds between progress edits of the /role delete response
+DELETE_PROGRESS_INTERVAL = 1.0
+
 role_group = app_commands.Group(name="role", description="Role management commands")
 
+@metrics.timed("discord.edit_member_roles")
+async def edit_member_roles(member: discord.Member, roles, add: bool, reason: str):
+    """
+    Add or remove all `roles` with a single member edit. If that request is
+    rejected, retry role by role so the caller can report which ones failed.
+    Returns a list of (role, error) pairs, error being None on success.
+    """
+    roles = list(dict.fromkeys(roles))
+    if not roles:
+        return []
+
+    apply = member.add_roles if add else member.remove_roles
+    try:
+        await apply(*roles, reason=reason, atomic=False)
+        return [(role, None) for role in roles]
+    except discord.HTTPException as e:
+        print(f"Bulk role {'add' if add else 'remove'} for member {member.id} failed ({e}), retrying per role")
+
+    results = []
+    for role in roles:
+        try:
+            await apply(role, reason=reason)
+            results.append((role, None))
+        except Exception as e:
+            results.append((role, e))
+    return results
+
+@metrics.timed("discord.edit_role_positions")
+async def place_roles(guild: discord.Guild, roles, under_role: discord.Role):
+    """
+    Move `roles` (top to bottom) directly under `under_role` with a single
+    edit_role_positions call that only carries the roles whose position changes.
+    """
+    positions = plan_role_positions(guild.roles, roles, under_role)
+    if positions:
+        await guild.edit_role_positions(positions=positions)
+    print(f"Repositioned {len(positions)} of {len(guild.roles)} roles in guild {guild.id}")
+
 @role_group.command(name="create")
 @app_commands.describe(
     rolename="Role name",
@@ -49,33 +99,15 @@ async def create(interaction: discord.Interaction, rolename: str, color: str, pl
     await interaction.response.defer(ephemeral=True)
 
     try:
-        new_role = await guild.create_role(
-            name=rolename,
-            color=role_color,
-            reason=f"Created by {interaction.user}"
-        )
+        with metrics.span("discord.create_role"):
+            new_role = await guild.create_role(
+                name=rolename,
+                color=role_color,
+                reason=f"Created by {interaction.user}"
+            )
 
         try:
-            roles = sorted(guild.roles, key=lambda r: r.position, reverse=True)
-            target_position = under_role.position - 1
-
-            new_roles = []
-            inserted = False
-            for role in roles:
-                if not inserted and role.position <= target_position:
-                    new_roles.append(new_role)
-                    inserted = True
-                if role != new_role:
-                    new_roles.append(role)
-            if not inserted:
-                new_roles.append(new_role)
-
-            new_positions = {
-                role: len(new_roles) - index - 1
-                for index, role in enumerate(new_roles)
-            }
-
-            await guild.edit_role_positions(positions=new_positions)
+            await place_roles(guild, [new_role], under_role)
 
             await interaction.followup.send(
                 f"✅ Role '{rolename}' created successfully under '{placeunder}'.",
@@ -87,7 +119,7 @@ async def create(interaction: discord.Interaction, rolename: str, color: str, pl
             await interaction.followup.send(
                 "I don't have permission to move roles.", ephemeral=True
             )
-        except discord.HTTPException as e:
+        except (discord.HTTPException, ValueError) as e:
             await new_role.delete()
             await interaction.followup.send(
                 f"Failed to position role: {str(e)}",
@@ -100,53 +132,181 @@ async def create(interaction: discord.Interaction, rolename: str, color: str, pl
             ephemeral=True
         )
 
-@role_group.command(name="delete")
-@app_commands.describe(rolenames="Comma-separated list of roles to delete")
-async def delete(interaction: discord.Interaction, rolenames: str):
-    print(f"Executing 'role delete' command by user {interaction.user.id} with rolenames={rolenames}")
-    role_names = [r.strip() for r in rolenames.split(",")]
-    deleted = []
-    failed = []
+@role_group.command(name="create_many")
+@app_commands.describe(
+    rolenames="Comma-separated role names, top to bottom",
+    color="Hex color for all new roles, e.g., #FF0000",
+    placeunder="Place the new roles under this role"
+)
+@app_commands.autocomplete(placeunder=role_autocomplete)
+async def create_many(interaction: discord.Interaction, rolenames: str, color: str, placeunder: str):
+    print(f"Executing 'role create_many' command by user {interaction.user.id} with rolenames={rolenames}, color={color}, placeunder={placeunder}")
 
-    for name in role_names:
-        role = None
-        if name.startswith("<@&") and name.endswith(">"):
-            try:
-                role_id = int(name[3:-1])
-                role = interaction.guild.get_role(role_id)
-            except ValueError:
-                pass
-        if role is None:
-            try:
-                role = interaction.guild.get_role(int(name))
-            except ValueError:
-                pass
-        if role is None:
-            role = discord.utils.get(interaction.guild.roles, name=name)
+    if not has_permission(interaction, "role", "create"):
+        await interaction.response.send_message("You don't have permission to create roles.", ephemeral=True)
+        return
 
-        if not role:
-            failed.append(f"❌ '{name}' (not found)")
-            continue
+    guild = interaction.guild
+    names = [name.strip() for name in rolenames.split(",") if name.strip()]
+    if not names:
+        await interaction.response.send_message("No role names provided.", ephemeral=True)
+        return
 
-        if not can_manage_role(interaction, role.id):
-            failed.append(f"⚠️ '{name}' (no permission)")
-            continue
+    under_role = discord.utils.get(guild.roles, name=placeunder)
+    if not under_role:
+        await interaction.response.send_message(f"Role '{placeunder}' not found.", ephemeral=True)
+        return
+
+    try:
+        role_color = discord.Color(int(color.strip("#"), 16))
+    except ValueError:
+        await interaction.response.send_message("Invalid color format. Use #RRGGBB.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
 
+    created = []
+    failed = []
+    for name in names:
         try:
+            with metrics.span("discord.create_role"):
+                created.append(await guild.create_role(name=name, color=role_color, reason=f"Created by {interaction.user}"))
             await logger.log(
                 interaction.client,
                 interaction,
-                Action="Delete",
-                RoleName=role.name,
-                RoleID=role.id
+                Action="Create",
+                RoleName=name,
+                Color=color,
+                PlaceUnder=placeunder
             )
-            await role.delete(reason=f"Deleted by {interaction.user}")
-            deleted.append(f"✅ {role.name}")
-        except Exception as e:
-            failed.append(f"❌ '{role.name}' ({e})")
+        except discord.HTTPException as e:
+            failed.append(f"❌ '{name}' ({e})")
 
-    response = "Deleted roles:\n" + "\n".join(deleted + failed)
-    await interaction.response.send_message(response, ephemeral=True)
+    try:
+        await place_roles(guild, created, under_role)
+    except (discord.HTTPException, ValueError) as e:
+        failed.append(f"⚠️ Roles were created but could not be positioned: {e}")
+
+    response = f"Created roles under '{placeunder}':\n" + "\n".join([f"✅ {role.name}" for role in created] + failed)
+    await interaction.followup.send(response, ephemeral=True)
+
+@role_group.command(name="move")
+@app_commands.describe(
+    rolename="Role to move",
+    placeunder="Place the role directly under this role"
+)
+@app_commands.autocomplete(rolename=role_autocomplete, placeunder=role_autocomplete)
+async def move(interaction: discord.Interaction, rolename: str, placeunder: str):
+    print(f"Executing 'role move' command by user {interaction.user.id} with rolename={rolename}, placeunder={placeunder}")
+    guild = interaction.guild
+    role = discord.utils.get(guild.roles, name=rolename)
+    under_role = discord.utils.get(guild.roles, name=placeunder)
+    if not role or not under_role:
+        await interaction.response.send_message(f"Role '{rolename if not role else placeunder}' not found.", ephemeral=True)
+        return
+
+    if not can_manage_role(interaction, role.id):
+        await interaction.response.send_message("You don't have permission to move this role.", ephemeral=True)
+        return
+
+    await logger.log(
+        interaction.client,
+        interaction,
+        Action="Move",
+        RoleName=role.name,
+        RoleID=role.id,
+        PlaceUnder=under_role.name
+    )
+
+    try:
+        await place_roles(guild, [role], under_role)
+    except discord.Forbidden:
+        await interaction.response.send_message("I don't have permission to move roles.", ephemeral=True)
+        return
+    except (discord.HTTPException, ValueError) as e:
+        await interaction.response.send_message(f"Failed to move role: {e}", ephemeral=True)
+        return
+
+    await interaction.response.send_message(f"✅ Role '{role.name}' moved under '{under_role.name}'.", ephemeral=True)
+
+@role_group.command(name="delete")
+@app_commands.describe(
+    rolenames="Comma-separated list of roles to delete",
+    dry_run="Only list what would be deleted (optional, default: False)"
+)
+async def delete(interaction: discord.Interaction, rolenames: str, dry_run: bool = False):
+    print(f"Executing 'role delete' command by user {interaction.user.id} with rolenames={rolenames}, dry_run={dry_run}")
+    # Deleting dozens of roles takes longer than the 3 second response deadline
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    roles, errors = role_resolver.resolve(interaction.guild, rolenames)
+    to_delete = {}
+    failed = [str(error) for error in errors]
+
+    for role in roles:
+        if not can_manage_role(interaction, role.id):
+            failed.append(f"⚠️ '{role.name}' (no permission)")
+            continue
+
+        to_delete[role.id] = role
+
+    if dry_run:
+        lines = [
+            f"🔍 {role.name} ({role.id})" if role.is_assignable() else f"⚠️ {role.name} (managed or above my top role, would fail)"
+            for role in to_delete.values()
+        ]
+        await interaction.edit_original_response(
+            content=_result_message(f"Dry run, {len(to_delete)} roles would be deleted:", lines + failed)
+        )
+        return
+
+    # Result line per role, reported in the order the roles were given
+    results = {}
+    semaphore = asyncio.Semaphore(DELETE_CONCURRENCY)
+
+    async def delete_role(role):
+        async with semaphore:
+            try:
+                with metrics.span("discord.delete_role"):
+                    await role.delete(reason=f"Deleted by {interaction.user}")
+            except discord.HTTPException as e:
+                results[role.id] = f"❌ '{role.name}' ({e})"
+                return
+        results[role.id] = f"✅ {role.name}"
+        await logger.log(
+            interaction.client,
+            interaction,
+            Action="Delete",
+            RoleName=role.name,
+            RoleID=role.id
+        )
+
+    def lines():
+        return [results[role_id] for role_id in to_delete if role_id in results] + failed
+
+    last_report = time.monotonic()
+    for done in asyncio.as_completed([delete_role(role) for role in to_delete.values()]):
+        await done
+        if time.monotonic() - last_report >= DELETE_PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            title = f"Deleting roles ({len(results)}/{len(to_delete)})..."
+            try:
+                await interaction.edit_original_response(content=_result_message(title, lines()))
+            except discord.HTTPException:
+                # Progress is best effort; the final result is sent below
+                pass
+
+    await interaction.edit_original_response(content=_result_message("Deleted roles:", lines()))
+
+def _result_message(title, lines):
+    """`title` and as many `lines` as fit in one message, noting how many were left out."""
+    message = title
+    for shown, line in enumerate(lines):
+        rest = f"\n...and {len(lines) - shown} more"
+        if len(message) + 1 + len(line) + len(rest) > 2000:
+            return message + rest
+        message += "\n" + line
+    return message
 
 @role_group.command(name="edit")
 @app_commands.describe(
@@ -190,8 +350,6 @@ async def edit(interaction: discord.Interaction, rolename: str, newname: str = N
             await interaction.response.send_message("Invalid manager format. Use a mention or ID.", ephemeral=True)
             return
 
-        add_role_manager(role.id, manager_id)
-
     if roleadmin:
         try:
             if roleadmin.startswith("<@&") and roleadmin.endswith(">"):
@@ -204,14 +362,22 @@ async def edit(interaction: discord.Interaction, rolename: str, newname: str = N
             await interaction.response.send_message("Invalid admin format. Use a mention or ID.", ephemeral=True)
             return
 
-        add_role_admin(role.id, admin_id)
+    if rolemanager or roleadmin:
+        # Both IDs are parsed first so that a bad one leaves nothing half-applied
+        async with permission_transaction(interaction.guild.id) as txn:
+            if rolemanager:
+                txn.add_role_manager(role.id, manager_id)
+            if roleadmin:
+                txn.add_role_admin(role.id, admin_id)
 
     if not kwargs and not rolemanager and not roleadmin:
         await interaction.response.send_message("No updates provided.", ephemeral=True)
         return
 
     try:
-        await role.edit(**kwargs, reason=f"Edited by {interaction.user}")
+        with metrics.span("discord.edit_role"):
+            await role.edit(**kwargs, reason=f"Edited by {interaction.user}")
+        role_search.touch(interaction.guild, role.id)
         await interaction.response.send_message(f"Role '{rolename}' updated.", ephemeral=True)
     except Exception as e:
         await interaction.response.send_message(f"Failed to update role: {e}", ephemeral=True)
@@ -223,46 +389,33 @@ async def edit(interaction: discord.Interaction, rolename: str, newname: str = N
 )
 async def assign(interaction: discord.Interaction, user: discord.Member, roles: str):
     print(f"Executing 'role assign' command by user {interaction.user.id} with user={user.id}, roles={roles}")
-    role_names = [r.strip() for r in roles.split(",")]
+    resolved, errors = role_resolver.resolve(interaction.guild, roles)
     added = []
-    failed = []
-
-    for name in role_names:
-        role = None
-        if name.startswith("<@&") and name.endswith(">"):
-            try:
-                role_id = int(name[3:-1])
-                role = interaction.guild.get_role(role_id)
-            except ValueError:
-                pass
-        if role is None:
-            try:
-                role = interaction.guild.get_role(int(name))
-            except ValueError:
-                role = discord.utils.get(interaction.guild.roles, name=name)
-
-        if not role:
-            failed.append(f"❌ '{name}' (not found)")
-            continue
+    failed = [str(error) for error in errors]
+    to_add = []
 
+    for role in resolved:
         if not can_manage_role(interaction, role.id, action="assign"):
-            failed.append(f"⚠️ '{name}' (no permission)")
+            failed.append(f"⚠️ '{role.name}' (no permission)")
             continue
 
-        try:
-            await logger.log(
-                interaction.client,
-                interaction,
-                Action="Assign",
-                TargetName=user.name,
-                TargetID=user.id,
-                RoleName=f"<@&{role.id}>",
-                RoleID=role.id
-            )
-            await user.add_roles(role, reason=f"Assigned by {interaction.user}")
-            added.append(f"✅ {role.name}")
-        except Exception as e:
-            failed.append(f"❌ '{role.name}' ({e})")
+        to_add.append(role)
+
+    for role, error in await edit_member_roles(user, to_add, add=True, reason=f"Assigned by {interaction.user}"):
+        if error:
+            failed.append(f"❌ '{role.name}' ({error})")
+            continue
+        await logger.log(
+            interaction.client,
+            interaction,
+            Action="Assign",
+            TargetName=user.name,
+            TargetID=user.id,
+            RoleName=f"<@&{role.id}>",
+            RoleID=role.id
+        )
+        added.append(f"✅ {role.name}")
+        role_search.touch(interaction.guild, role.id)
 
     response = f"Added roles to {user.mention}:\n" + "\n".join(added + failed)
     await interaction.response.send_message(response, ephemeral=True)
@@ -274,46 +427,33 @@ async def assign(interaction: discord.Interaction, user: discord.Member, roles:
 )
 async def unassign(interaction: discord.Interaction, user: discord.Member, roles: str):
     print(f"Executing 'role unassign' command by user {interaction.user.id} with user={user.id}, roles={roles}")
-    role_names = [r.strip() for r in roles.split(",")]
+    resolved, errors = role_resolver.resolve(interaction.guild, roles)
     removed = []
-    failed = []
-
-    for name in role_names:
-        role = None
-        if name.startswith("<@&") and name.endswith(">"):
-            try:
-                role_id = int(name[3:-1])
-                role = interaction.guild.get_role(role_id)
-            except ValueError:
-                pass
-        if role is None:
-            try:
-                role = interaction.guild.get_role(int(name))
-            except ValueError:
-                role = discord.utils.get(interaction.guild.roles, name=name)
-
-        if not role:
-            failed.append(f"❌ '{name}' (not found)")
-            continue
+    failed = [str(error) for error in errors]
+    to_remove = []
 
+    for role in resolved:
         if not can_manage_role(interaction, role.id, action="unassign"):
-            failed.append(f"⚠️ '{name}' (no permission)")
+            failed.append(f"⚠️ '{role.name}' (no permission)")
             continue
 
-        try:
-            await logger.log(
-                interaction.client,
-                interaction,
-                Action="Unassign",
-                TargetName=user.name,
-                TargetID=user.id,
-                RoleName=f"<@&{role.id}>",
-                RoleID=role.id
-            )
-            await user.remove_roles(role, reason=f"Removed by {interaction.user}")
-            removed.append(f"✅ {role.name}")
-        except Exception as e:
-            failed.append(f"❌ '{role.name}' ({e})")
+        to_remove.append(role)
+
+    for role, error in await edit_member_roles(user, to_remove, add=False, reason=f"Removed by {interaction.user}"):
+        if error:
+            failed.append(f"❌ '{role.name}' ({error})")
+            continue
+        await logger.log(
+            interaction.client,
+            interaction,
+            Action="Unassign",
+            TargetName=user.name,
+            TargetID=user.id,
+            RoleName=f"<@&{role.id}>",
+            RoleID=role.id
+        )
+        removed.append(f"✅ {role.name}")
+        role_search.touch(interaction.guild, role.id)
 
     response = f"Removed roles from {user.mention}:\n" + "\n".join(removed + failed)
     await interaction.response.send_message(response, ephemeral=True)
@@ -348,7 +488,8 @@ async def remove_manager(interaction: discord.Interaction, rolename: str, user:
         await interaction.response.send_message("Invalid user format. Use a mention or ID.", ephemeral=True)
         return
 
-    remove_role_manager(role.id, user_id)
+    async with permission_transaction(interaction.guild.id) as txn:
+        txn.remove_role_manager(role.id, user_id)
     await interaction.response.send_message(f"Removed {user} as manager for role '{role.name}'.", ephemeral=True)
 
 @role_group.command(name="remove_admin")
@@ -381,5 +522,108 @@ async def remove_admin(interaction: discord.Interaction, rolename: str, user: st
         await interaction.response.send_message("Invalid user format. Use a mention or ID.", ephemeral=True)
         return
 
-    remove_role_admin(role.id, user_id)
-    await interaction.response.send_message(f"Removed {user} as admin for role '{role.name}'.", ephemeral=True)
\ No newline at end of file
+    async with permission_transaction(interaction.guild.id) as txn:
+        txn.remove_role_admin(role.id, user_id)
+    await interaction.response.send_message(f"Removed {user} as admin for role '{role.name}'.", ephemeral=True)
+
+async def _run_bulk_job(interaction: discord.Interaction, job):
+    async def report(job):
+        try:
+            await interaction.edit_original_response(content=job.progress())
+        except discord.HTTPException:
+            # The interaction token expires after 15 minutes; the job keeps going
+            pass
+
+    async def log_chunk(job, changed):
+        if changed:
+            await logger.log(
+                interaction.client,
+                interaction,
+                Action=f"Bulk {'Assign' if job.action == 'add' else 'Unassign'}",
+                JobID=job.id,
+                RoleName=f"<@&{job.role_id}>",
+                MembersChanged=changed,
+                Cursor=job.cursor
+            )
+
+    await bulk_roles.run(
+        job,
+        interaction.guild,
+        reason=f"Bulk {job.action} job {job.id} by {interaction.user}",
+        on_progress=report,
+        on_chunk=log_chunk
+    )
+
+@role_group.command(name="bulk")
+@app_commands.describe(
+    action="add or remove",
+    rolename="Role to add to or remove from members",
+    holders_of="Only change members holding this role (optional, default: everyone)"
+)
+@app_commands.autocomplete(rolename=role_autocomplete, holders_of=role_autocomplete)
+async def bulk(interaction: discord.Interaction, action: str, rolename: str, holders_of: str = None):
+    print(f"Executing 'role bulk' command by user {interaction.user.id} with action={action}, rolename={rolename}, holders_of={holders_of}")
+    if action not in ("add", "remove"):
+        await interaction.response.send_message("Action must be 'add' or 'remove'.", ephemeral=True)
+        return
+
+    role = role_resolver.resolve_one(interaction.guild, rolename.strip())
+    if isinstance(role, UnresolvedRole):
+        await interaction.response.send_message(str(role), ephemeral=True)
+        return
+
+    filter_role = None
+    if holders_of:
+        filter_role = role_resolver.resolve_one(interaction.guild, holders_of.strip())
+        if isinstance(filter_role, UnresolvedRole):
+            await interaction.response.send_message(str(filter_role), ephemeral=True)
+            return
+
+    if not has_permission(interaction, "role", "bulk") or not can_manage_role(interaction, role.id, action="assign" if action == "add" else "unassign"):
+        await interaction.response.send_message("You don't have permission to run bulk changes for this role.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    job = bulk_roles.create(interaction.guild.id, action, role.id, filter_role.id if filter_role else None, interaction.user.id)
+    await logger.log(
+        interaction.client,
+        interaction,
+        Action="Bulk Start",
+        JobID=job.id,
+        Change=f"{action} <@&{role.id}>",
+        HoldersOf=f"<@&{filter_role.id}>" if filter_role else "everyone"
+    )
+    await _run_bulk_job(interaction, job)
+
+@role_group.command(name="bulk_resume")
+@app_commands.describe(job_id="ID of an interrupted or cancelled bulk job")
+async def bulk_resume(interaction: discord.Interaction, job_id: str):
+    job = bulk_roles.get(interaction.guild.id, job_id)
+    if not job:
+        await interaction.response.send_message(f"Bulk job `{job_id}` not found.", ephemeral=True)
+        return
+    if job.status == "done" or bulk_roles.is_running(job.id):
+        await interaction.response.send_message(f"Bulk job `{job_id}` is {'running' if job.status != 'done' else 'already done'}.", ephemeral=True)
+        return
+    if not has_permission(interaction, "role", "bulk") or not can_manage_role(interaction, job.role_id, action="assign" if job.action == "add" else "unassign"):
+        await interaction.response.send_message("You don't have permission to run bulk changes for this role.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    await logger.log(interaction.client, interaction, Action="Bulk Resume", JobID=job.id, Cursor=job.cursor)
+    await _run_bulk_job(interaction, job)
+
+@role_group.command(name="bulk_cancel")
+@app_commands.describe(job_id="ID of the bulk job to cancel")
+async def bulk_cancel(interaction: discord.Interaction, job_id: str):
+    job = bulk_roles.get(interaction.guild.id, job_id)
+    if not job:
+        await interaction.response.send_message(f"Bulk job `{job_id}` not found.", ephemeral=True)
+        return
+    if not has_permission(interaction, "role", "bulk") or not can_manage_role(interaction, job.role_id, action="assign" if job.action == "add" else "unassign"):
+        await interaction.response.send_message("You don't have permission to cancel this bulk job.", ephemeral=True)
+        return
+
+    bulk_roles.cancel(job)
+    await logger.log(interaction.client, interaction, Action="Bulk Cancel", JobID=job.id, Cursor=job.cursor)
+    await interaction.response.send_message(f"Cancelling bulk job `{job.id}`. Resume it later with `/role bulk_resume`.", ephemeral=True)
@@ -1,7 +1,11 @@
 import os
-import json
 from dotenv import load_dotenv
 import pathlib
+from storage.audit_store import AuditStore
+from storage.json_store import JsonStore
+from storage.lazy import LazyGuildSettings, LazyPermissions, LazyRoleIndex
+from storage.sharded_store import ShardedJsonStore
+from storage.sqlite_store import SqliteStore
 
 # Debug .env loading with more verbose output
 current_dir = pathlib.Path(__file__).parent.absolute()
@@ -21,65 +25,82 @@ TOKEN = os.environ.get('DISCORD_TOKEN')
 if not TOKEN:
     raise ValueError("[ERROR] Could not load DISCORD_TOKEN")
 
-print(f"[DEBUG] Full Token: {TOKEN}")
-print(f"[DEBUG] Token length: {len(TOKEN)}")
-print(f"[DEBUG] Token first/last 5 chars: {TOKEN[:5]}...{TOKEN[-5:]}")
+print(f"[DEBUG] Token loaded ({len(TOKEN)} chars)")
 
 ALLOWED_ROLE_NAMES = ["Admin", "Mod"]
 ALLOWED_USER_IDS = []
 
 PERMISSIONS_FILE = "permissions.json"
-PERMISSIONS = {}
-ROLE_MANAGERS = {}
-ROLE_ADMINS = {}
-
-
-if os.path.exists(PERMISSIONS_FILE):
-    with open(PERMISSIONS_FILE, "r") as f:
-        loaded_permissions = json.load(f)
-        PERMISSIONS = {
-            int(guild_id): {
-                int(user_or_role_id): commands
-                for user_or_role_id, commands in users_or_roles.items()
-            }
-            for guild_id, users_or_roles in loaded_permissions.get("permissions", {}).items()
-        }
-        ROLE_MANAGERS = {
-            int(role_id): [int(manager_id) for manager_id in managers]
-            for role_id, managers in loaded_permissions.get("role_managers", {}).items()
-        }
-        ROLE_ADMINS = {
-            int(role_id): [int(admin_id) for admin_id in admins]
-            for role_id, admins in loaded_permissions.get("role_admins", {}).items()
-        }
-
-    print(f"Loaded PERMISSIONS: {json.dumps(PERMISSIONS, indent=4)}")
-    print(f"Loaded ROLE_MANAGERS: {json.dumps(ROLE_MANAGERS, indent=4)}")
-    print(f"Loaded ROLE_ADMINS: {json.dumps(ROLE_ADMINS, indent=4)}")
+# One <guild_id>.json per guild; an existing PERMISSIONS_FILE is split into it once
+PERMISSIONS_DIR = os.environ.get("PERMISSIONS_DIR", "permissions")
+PERMISSIONS_DB = os.environ.get("PERMISSIONS_DB", "permissions.db")
+# Storage backend for permission state: "sharded" (PERMISSIONS_DIR), "json" (PERMISSIONS_FILE)
+# or "sqlite" (PERMISSIONS_DB)
+PERMISSIONS_BACKEND = os.environ.get("PERMISSIONS_BACKEND", "sharded")
+# Seconds to coalesce permission mutations before rewriting PERMISSIONS_FILE (json backend)
+PERMISSIONS_SAVE_DELAY = float(os.environ.get("PERMISSIONS_SAVE_DELAY", "1.0"))
+# Journal records per guild before its snapshot is rewritten (sharded backend)
+PERMISSIONS_COMPACT_EVERY = int(os.environ.get("PERMISSIONS_COMPACT_EVERY", "1000"))
+# Compacted journals kept per guild as change history (sharded backend); 0 deletes them
+PERMISSIONS_JOURNAL_HISTORY = int(os.environ.get("PERMISSIONS_JOURNAL_HISTORY", "10"))
+# "1" makes a grant on a role also apply to every role ranked above it
+PERMISSIONS_INHERIT = os.environ.get("PERMISSIONS_INHERIT", "0") == "1"
+
+# Local audit log queried by /auditlog; entries older than AUDIT_RETENTION_DAYS (0 = never) are deleted
+AUDIT_DB = os.environ.get("AUDIT_DB", "audit.db")
+AUDIT_RETENTION_DAYS = int(os.environ.get("AUDIT_RETENTION_DAYS", "90"))
+
+# Set by cluster.py for each bot process: the shards it runs and the hub socket
+# used to broadcast cache invalidations to the other processes
+SHARD_COUNT = int(os.environ["SHARD_COUNT"]) if os.environ.get("SHARD_COUNT") else None
+SHARD_IDS = [int(shard_id) for shard_id in os.environ["SHARD_IDS"].split(",")] if os.environ.get("SHARD_IDS") else None
+CLUSTER_ID = int(os.environ.get("CLUSTER_ID", "0"))
+CLUSTER_SOCKET = os.environ.get("CLUSTER_SOCKET")
+
+# Above 0, members are not cached by discord.py or chunked at startup; only this many
+# recently active members are kept and others are fetched when needed
+MEMBER_CACHE_SIZE = int(os.environ.get("MEMBER_CACHE_SIZE", "0"))
+
+# Outbound API requests in flight at once (logging gets half), and per rate limit bucket
+SCHEDULER_MAX_IN_FLIGHT = int(os.environ.get("SCHEDULER_MAX_IN_FLIGHT", "8"))
+SCHEDULER_BUCKET_IN_FLIGHT = int(os.environ.get("SCHEDULER_BUCKET_IN_FLIGHT", "2"))
+
+# Optional local Prometheus endpoint, disabled unless METRICS_PORT is set
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+def create_permission_store(backend):
+    if backend == "sharded":
+        return ShardedJsonStore(
+            PERMISSIONS_DIR, legacy_path=PERMISSIONS_FILE, compact_every=PERMISSIONS_COMPACT_EVERY,
+            journal_history=PERMISSIONS_JOURNAL_HISTORY
+        )
+    if backend == "json":
+        return JsonStore(PERMISSIONS_FILE, save_delay=PERMISSIONS_SAVE_DELAY)
+    if backend == "sqlite":
+        return SqliteStore(PERMISSIONS_DB, json_path=PERMISSIONS_FILE)
+    raise ValueError(f"[ERROR] Unknown PERMISSIONS_BACKEND '{backend}'")
+
+if CLUSTER_SOCKET and PERMISSIONS_BACKEND == "json":
+    raise ValueError("[ERROR] PERMISSIONS_BACKEND 'json' rewrites one shared file and cannot be used by several processes; use 'sharded' or 'sqlite'")
+
+PERMISSION_STORE = create_permission_store(PERMISSIONS_BACKEND)
+# Nothing is read from the store until first use
+PERMISSIONS = LazyPermissions(PERMISSION_STORE)
+ROLE_MANAGERS = LazyRoleIndex(PERMISSION_STORE, "role_managers")
+ROLE_ADMINS = LazyRoleIndex(PERMISSION_STORE, "role_admins")
+GUILD_SETTINGS = LazyGuildSettings(PERMISSION_STORE)
+PERMISSION_STORE.attach(PERMISSIONS, ROLE_MANAGERS, ROLE_ADMINS, GUILD_SETTINGS)
+
+AUDIT_STORE = AuditStore(AUDIT_DB, retention_days=AUDIT_RETENTION_DAYS)
 
 def save_permissions():
-    cleaned_permissions = {
-        "permissions": {
-            str(guild_id): {
-                str(user_or_role_id): {
-                    command: subcommands
-                    for command, subcommands in commands.items() if subcommands
-                }
-                for user_or_role_id, commands in users_or_roles.items() if commands
-            }
-            for guild_id, users_or_roles in PERMISSIONS.items() if users_or_roles
-        },
-        "role_managers": {
-            str(role_id): [str(manager_id) for manager_id in managers]
-            for role_id, managers in ROLE_MANAGERS.items() if managers
-        },
-        "role_admins": {
-            str(role_id): [str(admin_id) for admin_id in admins]
-            for role_id, admins in ROLE_ADMINS.items() if admins
-        }
-    }
-
-    print(f"Saving cleaned PERMISSIONS: {json.dumps(cleaned_permissions, indent=4)}")
-
-    with open(PERMISSIONS_FILE, "w") as f:
-        json.dump(cleaned_permissions, f, indent=4)
+    """
+    Persist the whole permission state. Mutations made through utils.permissions
+    are persisted individually; this is only needed after editing the dicts directly.
+    """
+    PERMISSION_STORE.save()
+
+def flush_permissions():
+    """Write pending permission changes immediately. Call on shutdown."""
+    PERMISSION_STORE.close()
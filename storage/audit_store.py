@@ -0,0 +1,155 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from utils.metrics import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit_log (
+    id INTEGER PRIMARY KEY,
+    at REAL NOT NULL,
+    guild_id INTEGER NOT NULL,
+    actor_id INTEGER NOT NULL,
+    action TEXT NOT NULL COLLATE NOCASE,
+    target_id INTEGER,
+    details TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS audit_by_guild ON audit_log (guild_id, at);
+CREATE INDEX IF NOT EXISTS audit_by_actor ON audit_log (guild_id, actor_id, at);
+CREATE INDEX IF NOT EXISTS audit_by_target ON audit_log (guild_id, target_id, at);
+CREATE INDEX IF NOT EXISTS audit_by_action ON audit_log (guild_id, action, at);
+"""
+
+# Seconds between retention sweeps
+PRUNE_INTERVAL = 3600.0
+
+
+class AuditStore:
+    """
+    Local SQLite copy of every audit event the Logger emits, indexed by
+    guild, actor, target and action for /auditlog.
+
+    record() only appends to an in-memory buffer; the buffer is written in
+    one transaction from a worker thread `flush_delay` seconds after its
+    first entry, or as soon as it holds `batch_size` entries. Entries older
+    than `retention_days` (0 keeps everything) are deleted at most once per
+    PRUNE_INTERVAL. Outside an event loop entries are written immediately.
+    """
+
+    def __init__(self, path, flush_delay=1.0, batch_size=500, retention_days=90):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # Several cluster processes may write the same file
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.executescript(SCHEMA)
+        self._buffer = []
+        self._handle = None
+        self._lock = threading.Lock()
+        self._tasks = set()
+        self._pruned_at = 0.0
+
+    def record(self, guild_id, actor_id, action, target_id=None, **details):
+        self._buffer.append((
+            time.time(), guild_id, actor_id, action, target_id,
+            json.dumps({key: str(value) for key, value in details.items() if value is not None})
+        ))
+        metrics.inc("audit_records_total")
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+
+        if len(self._buffer) >= self.batch_size:
+            self._start_write(loop)
+        elif self._handle is None:
+            self._handle = loop.call_later(self.flush_delay, self._start_write, loop)
+
+    def _take(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        rows, self._buffer = self._buffer, []
+        return rows
+
+    def _start_write(self, loop):
+        rows = self._take()
+        task = loop.create_task(self._write_in_thread(rows))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write_in_thread(self, rows):
+        with metrics.span("audit.write"):
+            await asyncio.to_thread(self._write, rows)
+
+    def _write(self, rows):
+        with self._lock:
+            try:
+                if rows:
+                    with self.conn:
+                        self.conn.execute("BEGIN")
+                        self.conn.executemany(
+                            "INSERT INTO audit_log (at, guild_id, actor_id, action, target_id, details) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            rows
+                        )
+                self._prune()
+            except sqlite3.Error as e:
+                print(f"Failed to write {len(rows)} audit entries to {self.path}: {e}")
+
+    def _prune(self):
+        now = time.time()
+        if not self.retention_days or now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        self.conn.execute("DELETE FROM audit_log WHERE at < ?", (now - self.retention_days * 86400,))
+
+    async def aflush(self):
+        """Write everything buffered so far and wait for writes in progress."""
+        rows = self._take()
+        if rows:
+            await self._write_in_thread(rows)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def flush(self):
+        """Write everything buffered, on the calling thread (use at shutdown)."""
+        self._write(self._take())
+
+    def _query(self, guild_id, actor_id, target_id, action, limit, offset):
+        where, params = ["guild_id = ?"], [guild_id]
+        for column, value in (("actor_id", actor_id), ("target_id", target_id), ("action", action)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        clause = " AND ".join(where)
+        with self._lock:
+            total = self.conn.execute(f"SELECT COUNT(*) FROM audit_log WHERE {clause}", params).fetchone()[0]
+            rows = self.conn.execute(
+                f"SELECT at, actor_id, action, target_id, details FROM audit_log WHERE {clause} "
+                "ORDER BY at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return [
+            {"at": at, "actor_id": actor, "action": action, "target_id": target, "details": json.loads(details)}
+            for at, actor, action, target, details in rows
+        ], total
+
+    @metrics.timed("audit.query")
+    async def query(self, guild_id, actor_id=None, target_id=None, action=None, limit=10, offset=0):
+        """
+        The guild's entries matching every given filter, newest first, as
+        (entries, total matches). Buffered entries are written first.
+        """
+        await self.aflush()
+        return await asyncio.to_thread(self._query, guild_id, actor_id, target_id, action, limit, offset)
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,105 @@
+from storage.lazy import LazyGuildSettings, LazyPermissions, LazyRoleIndex
+
+# Role entries that predate per-guild scoping, kept until a guild claims them.
+LEGACY_GUILD = 0
+
+ROLE_KINDS = ("role_managers", "role_admins")
+
+
+class PermissionStore:
+    """
+    Persistence backend for PERMISSIONS, ROLE_MANAGERS, ROLE_ADMINS and
+    GUILD_SETTINGS.
+
+    The in-memory structures are filled lazily through load_permissions(),
+    load_role_entries() and load_settings(), or one guild at a time through
+    load_guild(), load_guild_roles() and load_guild_settings() for stores
+    with per_guild = True. Role entries are {guild_id: {role_id: [user_id, ...]}}
+    and settings {guild_id: {key: value}}. The mutation hooks are
+    called after the in-memory state has been changed so that backends can
+    persist just the affected records; they all go through commit(), which
+    receives every change of a transaction at once. Backends that can only write whole
+    snapshots implement save() instead, using the live structures handed
+    to attach().
+    """
+
+    per_guild = False
+
+    def attach(self, permissions, role_managers, role_admins, settings):
+        pass
+
+    def load_permissions(self):
+        raise NotImplementedError
+
+    def load_guild(self, guild_id):
+        raise NotImplementedError
+
+    def load_role_entries(self, kind):
+        """{guild_id: {role_id: [user_id, ...]}} for kind "role_managers" or "role_admins"."""
+        raise NotImplementedError
+
+    def load_guild_roles(self, kind, guild_id):
+        raise NotImplementedError
+
+    def load_settings(self):
+        raise NotImplementedError
+
+    def load_guild_settings(self, guild_id):
+        raise NotImplementedError
+
+    def load(self):
+        """Load the whole state eagerly and return (permissions, role_managers, role_admins)."""
+        permissions = LazyPermissions(self)
+        role_managers = LazyRoleIndex(self, "role_managers")
+        role_admins = LazyRoleIndex(self, "role_admins")
+        settings = LazyGuildSettings(self)
+        self.attach(permissions, role_managers, role_admins, settings)
+        permissions.keys()
+        role_managers.items()
+        role_admins.items()
+        settings.items()
+        return permissions, role_managers, role_admins
+
+    def invalidate(self, guild_id=None):
+        """Forget anything cached for one guild, or all, after another process changed it."""
+        pass
+
+    def commit(self, guild_id, changes):
+        """
+        Persist one transaction's changes to a guild as a unit. `changes` is
+        a list of (op, args) in the order they were applied, op being one of
+        grant, revoke, add_role_manager, remove_role_manager, add_role_admin,
+        remove_role_admin or set_setting and args the hook's arguments after
+        guild_id.
+        """
+        self.save()
+
+    def grant(self, guild_id, principal_id, command, subcommand=None):
+        self.commit(guild_id, [("grant", (principal_id, command, subcommand))])
+
+    def revoke(self, guild_id, principal_id, command, subcommand=None):
+        self.commit(guild_id, [("revoke", (principal_id, command, subcommand))])
+
+    def add_role_manager(self, guild_id, role_id, user_id):
+        self.commit(guild_id, [("add_role_manager", (role_id, user_id))])
+
+    def remove_role_manager(self, guild_id, role_id, user_id):
+        self.commit(guild_id, [("remove_role_manager", (role_id, user_id))])
+
+    def add_role_admin(self, guild_id, role_id, user_id):
+        self.commit(guild_id, [("add_role_admin", (role_id, user_id))])
+
+    def remove_role_admin(self, guild_id, role_id, user_id):
+        self.commit(guild_id, [("remove_role_admin", (role_id, user_id))])
+
+    def set_setting(self, guild_id, key, value):
+        self.commit(guild_id, [("set_setting", (key, value))])
+
+    def save(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
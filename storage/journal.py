@@ -0,0 +1,164 @@
+import json
+import os
+import time
+
+PERMISSION = "permission"
+SETTING = "setting"
+
+
+def grant_record(guild_id, principal_id, command, subcommand=None):
+    return {"op": "add", "kind": PERMISSION, "guild": guild_id, "principal": principal_id,
+            "command": command, "subcommand": subcommand}
+
+
+def revoke_record(guild_id, principal_id, command, subcommand=None):
+    return {"op": "remove", "kind": PERMISSION, "guild": guild_id, "principal": principal_id,
+            "command": command, "subcommand": subcommand}
+
+
+def role_record(op, kind, guild_id, role_id, user_id):
+    """`kind` is "role_managers" or "role_admins"."""
+    return {"op": op, "kind": kind, "guild": guild_id, "role": role_id, "principal": user_id}
+
+
+def setting_record(guild_id, key, value):
+    return {"op": "set", "kind": SETTING, "guild": guild_id, "key": key, "value": value}
+
+
+def change_record(guild_id, op, args):
+    """The journal record for one (op, args) change as passed to PermissionStore.commit."""
+    if op == "set_setting":
+        return setting_record(guild_id, *args)
+    if op in ("grant", "revoke"):
+        return (grant_record if op == "grant" else revoke_record)(guild_id, *args)
+    action, _, kind = op.partition("_")
+    return role_record(action, kind + "s", guild_id, *args)
+
+
+def apply_record(sections, record):
+    """
+    Replay one journal record onto a guild's parsed sections
+    ({"permissions": {principal: {command: [sub, ...]}}, kind: {role: [user, ...]},
+    "settings": {key: value}}),
+    with the same semantics as the changes applied by PermissionTransaction
+    in utils.permissions. Replaying a record that is already
+    reflected in the sections leaves them unchanged.
+    """
+    if record["kind"] == SETTING:
+        settings = sections.setdefault("settings", {})
+        if record["value"] is None:
+            settings.pop(record["key"], None)
+        else:
+            settings[record["key"]] = record["value"]
+        return
+
+    principal_id = record["principal"]
+    if record["kind"] != PERMISSION:
+        users = sections.setdefault(record["kind"], {}).setdefault(record["role"], [])
+        if record["op"] == "add" and principal_id not in users:
+            users.append(principal_id)
+        elif record["op"] == "remove" and principal_id in users:
+            users.remove(principal_id)
+        if not users:
+            del sections[record["kind"]][record["role"]]
+        return
+
+    principals = sections.setdefault("permissions", {})
+    command, subcommand = record["command"], record["subcommand"]
+    if record["op"] == "add":
+        subcommands = principals.setdefault(principal_id, {}).setdefault(command, [])
+        if subcommand and subcommand not in subcommands:
+            subcommands.append(subcommand)
+        return
+
+    granted = principals.get(principal_id, {})
+    if command not in granted:
+        return
+    if subcommand:
+        if subcommand not in granted[command]:
+            return
+        granted[command].remove(subcommand)
+        if not granted[command]:
+            del granted[command]
+    else:
+        del granted[command]
+    if not granted:
+        del principals[principal_id]
+
+
+class Journal:
+    """
+    Append-only JSON-lines log of mutations for one snapshot file.
+
+    append() adds records and fsyncs them; records() yields the records
+    not yet folded into the snapshot; archive() is called once the
+    snapshot that includes them is on disk. It renames the file to
+    <stem>.<n><ext> and keeps the newest `keep` archives, so history()
+    can replay the guild's changes beyond the current snapshot. Callers
+    serialize access (ShardedJsonStore holds the guild lock around every
+    call).
+    """
+
+    def __init__(self, path, keep=10):
+        self.path = path
+        self.keep = keep
+        self.length = 0
+
+    def append(self, *records):
+        at = round(time.time(), 3)
+        lines = []
+        for record in records:
+            record["at"] = at
+            lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+        # One write per call, so a transaction's records land together
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+            f.flush()
+            # The journal is the only copy of a change until the next compaction
+            os.fsync(f.fileno())
+        self.length += len(records)
+
+    def records(self, path=None):
+        path = path or self.path
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A crash mid-append leaves a torn last line
+                    print(f"Skipping unreadable record at {path}:{line_number}")
+
+    def _archives(self):
+        """(number, path) of the archived journals, oldest first."""
+        directory, name = os.path.split(self.path)
+        stem, extension = os.path.splitext(name)
+        prefix = stem + "."
+        archives = []
+        for entry in os.listdir(directory or "."):
+            number = entry[len(prefix):len(entry) - len(extension)]
+            if entry.startswith(prefix) and entry.endswith(extension) and number.isdigit():
+                archives.append((int(number), os.path.join(directory, entry)))
+        return sorted(archives)
+
+    def archive(self):
+        if os.path.exists(self.path):
+            if self.keep > 0:
+                archives = self._archives()
+                # Make room for the journal being archived
+                for _, path in archives[:max(0, len(archives) + 1 - self.keep)]:
+                    os.unlink(path)
+                stem, extension = os.path.splitext(self.path)
+                os.replace(self.path, f"{stem}.{archives[-1][0] + 1 if archives else 1}{extension}")
+            else:
+                os.unlink(self.path)
+        self.length = 0
+
+    def history(self):
+        """Every record still on disk, archived journals first, in the order they were appended."""
+        for _, path in self._archives():
+            yield from self.records(path)
+        yield from self.records()
@@ -0,0 +1,131 @@
+import os
+import time
+from storage.base import LEGACY_GUILD, ROLE_KINDS, PermissionStore
+from utils.metrics import metrics
+from utils.persistence import WriteBehind, read_json
+
+
+def parse_principals(principals):
+    return {
+        int(user_or_role_id): commands
+        for user_or_role_id, commands in principals.items()
+    }
+
+
+def parse_permissions(loaded_permissions):
+    return {
+        int(guild_id): parse_principals(principals)
+        for guild_id, principals in loaded_permissions.get("permissions", {}).items()
+    }
+
+
+def parse_roles(roles):
+    return {
+        int(role_id): [int(user_id) for user_id in user_ids]
+        for role_id, user_ids in roles.items()
+    }
+
+
+def parse_role_entries(loaded_permissions, kind):
+    """
+    {guild_id: {role_id: [user_id, ...]}} from either layout of a role
+    section: keyed by guild, or the older flat {role_id: [user_id, ...]},
+    which is filed under LEGACY_GUILD.
+    """
+    entries = {}
+    for key, value in loaded_permissions.get(kind, {}).items():
+        if isinstance(value, dict):
+            entries.setdefault(int(key), {}).update(parse_roles(value))
+        else:
+            entries.setdefault(LEGACY_GUILD, {}).update(parse_roles({key: value}))
+    return entries
+
+
+def dump_principals(principals):
+    return {
+        str(user_or_role_id): {
+            command: list(subcommands)
+            for command, subcommands in commands.items()
+        }
+        for user_or_role_id, commands in principals.items() if commands
+    }
+
+
+def dump_roles(index):
+    return {
+        str(role_id): [str(user_id) for user_id in users]
+        for role_id, users in index.items() if users
+    }
+
+
+class JsonStore(PermissionStore):
+    """
+    Whole-state snapshot in a single JSON file, written behind a debounce window.
+
+    The file is parsed once, on the first load call; each section is handed
+    to the in-memory structures and then dropped.
+    """
+
+    def __init__(self, path, save_delay=1.0):
+        self.path = path
+        self._sections = None
+        self._state = None
+        self._writer = WriteBehind(path, self._snapshot, delay=save_delay)
+
+    def _section(self, name):
+        if self._sections is None:
+            document = {}
+            if os.path.exists(self.path):
+                start = time.perf_counter()
+                document = read_json(self.path)
+                print(
+                    f"[INFO] Parsed {self.path}: {os.path.getsize(self.path)} bytes, "
+                    f"{len(document.get('permissions', {}))} guilds in {(time.perf_counter() - start) * 1000:.1f} ms"
+                )
+            self._sections = {"permissions": parse_permissions(document)}
+            for kind in ROLE_KINDS:
+                self._sections[kind] = parse_role_entries(document, kind)
+            self._sections["settings"] = {
+                int(guild_id): settings for guild_id, settings in document.get("settings", {}).items()
+            }
+        return self._sections.pop(name, {})
+
+    def load_permissions(self):
+        return self._section("permissions")
+
+    def load_role_entries(self, kind):
+        return self._section(kind)
+
+    def load_settings(self):
+        return self._section("settings")
+
+    def attach(self, permissions, role_managers, role_admins, settings):
+        self._state = (permissions, role_managers, role_admins, settings)
+
+    def _snapshot(self):
+        permissions, role_managers, role_admins, settings = self._state
+        return {
+            "permissions": {
+                str(guild_id): dump_principals(principals)
+                for guild_id, principals in permissions.items() if principals
+            },
+            "role_managers": {
+                str(guild_id): dump_roles(index)
+                for guild_id, index in role_managers.items() if len(index)
+            },
+            "role_admins": {
+                str(guild_id): dump_roles(index)
+                for guild_id, index in role_admins.items() if len(index)
+            },
+            "settings": {
+                str(guild_id): dict(values)
+                for guild_id, values in settings.items() if values
+            }
+        }
+
+    @metrics.timed("permissions.persist")
+    def save(self):
+        self._writer.schedule()
+
+    def flush(self):
+        self._writer.flush()
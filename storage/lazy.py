@@ -0,0 +1,250 @@
+from utils.role_index import RoleIndex
+
+
+class LazyPermissions(dict):
+    """
+    PERMISSIONS as a dict keyed by guild id that is filled from the store on
+    first access.
+
+    Lookups of a single guild (`in`, [], get, setdefault, ...) load only that
+    guild when the store supports it (store.per_guild); anything that needs
+    the whole map (iteration, len, items, ...) loads everything once.
+    Guilds already loaded or created in memory are never overwritten.
+    """
+
+    def __init__(self, store):
+        super().__init__()
+        self._store = store
+        self._loaded = False
+        self._loaded_guilds = set()
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def _load_all(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        for guild_id, principals in self._store.load_permissions().items():
+            if guild_id not in self._loaded_guilds:
+                dict.__setitem__(self, guild_id, principals)
+        self._loaded_guilds.clear()
+
+    def _load_guild(self, guild_id):
+        if self._loaded or guild_id in self._loaded_guilds:
+            return
+        if not self._store.per_guild:
+            self._load_all()
+            return
+        self._loaded_guilds.add(guild_id)
+        principals = self._store.load_guild(guild_id)
+        if principals:
+            dict.__setitem__(self, guild_id, principals)
+
+    # Single-guild access
+    def __contains__(self, guild_id):
+        self._load_guild(guild_id)
+        return dict.__contains__(self, guild_id)
+
+    def __getitem__(self, guild_id):
+        self._load_guild(guild_id)
+        return dict.__getitem__(self, guild_id)
+
+    def get(self, guild_id, default=None):
+        self._load_guild(guild_id)
+        return dict.get(self, guild_id, default)
+
+    def setdefault(self, guild_id, default=None):
+        self._load_guild(guild_id)
+        return dict.setdefault(self, guild_id, default)
+
+    def __setitem__(self, guild_id, principals):
+        self._load_guild(guild_id)
+        dict.__setitem__(self, guild_id, principals)
+
+    def __delitem__(self, guild_id):
+        self._load_guild(guild_id)
+        dict.__delitem__(self, guild_id)
+
+    def pop(self, guild_id, *default):
+        self._load_guild(guild_id)
+        return dict.pop(self, guild_id, *default)
+
+    # Whole-map access
+    def __iter__(self):
+        self._load_all()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._load_all()
+        return dict.__len__(self)
+
+    def __repr__(self):
+        self._load_all()
+        return dict.__repr__(self)
+
+    def keys(self):
+        self._load_all()
+        return dict.keys(self)
+
+    def values(self):
+        self._load_all()
+        return dict.values(self)
+
+    def items(self):
+        self._load_all()
+        return dict.items(self)
+
+    def update(self, *args, **kwargs):
+        self._load_all()
+        dict.update(self, *args, **kwargs)
+
+    def clear(self):
+        self._loaded = True
+        self._loaded_guilds.clear()
+        dict.clear(self)
+
+    def invalidate(self, guild_id=None):
+        """Drop cached state so it is read from the store again: one guild, or everything."""
+        if guild_id is None or not self._store.per_guild:
+            dict.clear(self)
+            self._loaded = False
+            self._loaded_guilds.clear()
+            return
+        dict.pop(self, guild_id, None)
+        self._loaded_guilds.discard(guild_id)
+        if self._loaded:
+            # _load_guild is a no-op once everything is loaded; reload this guild now
+            principals = self._store.load_guild(guild_id)
+            if principals:
+                dict.__setitem__(self, guild_id, principals)
+
+
+class LazyRoleIndex:
+    """
+    ROLE_MANAGERS / ROLE_ADMINS: one RoleIndex per guild, filled from the
+    store the first time that guild is used.
+
+    `kind` is "role_managers" or "role_admins". Like LazyPermissions, stores
+    without per_guild support are loaded completely on first use.
+    """
+
+    def __init__(self, store, kind):
+        self._store = store
+        self._kind = kind
+        self._guilds = {}
+        self._loaded = False
+
+    def _load_all(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        for guild_id, entries in self._store.load_role_entries(self._kind).items():
+            if guild_id not in self._guilds:
+                self._guilds[guild_id] = RoleIndex(entries)
+
+    def for_guild(self, guild_id):
+        index = self._guilds.get(guild_id)
+        if index is not None:
+            return index
+        if self._store.per_guild:
+            index = RoleIndex(self._store.load_guild_roles(self._kind, guild_id))
+        else:
+            self._load_all()
+            index = self._guilds.get(guild_id) or RoleIndex()
+        self._guilds[guild_id] = index
+        return index
+
+    def add(self, guild_id, role_id, user_id):
+        return self.for_guild(guild_id).add(role_id, user_id)
+
+    def remove(self, guild_id, role_id, user_id):
+        return self.for_guild(guild_id).remove(role_id, user_id)
+
+    def contains(self, guild_id, role_id, user_id):
+        return self.for_guild(guild_id).contains(role_id, user_id)
+
+    def members(self, guild_id, role_id):
+        return self.for_guild(guild_id).members(role_id)
+
+    def roles_of(self, guild_id, user_id):
+        return self.for_guild(guild_id).roles_of(user_id)
+
+    def items(self):
+        """(guild_id, RoleIndex) for every guild, loading all of them."""
+        self._load_all()
+        return self._guilds.items()
+
+    def clear(self):
+        self._loaded = True
+        self._guilds.clear()
+
+    def invalidate(self, guild_id=None):
+        if guild_id is None or not self._store.per_guild:
+            self._loaded = False
+            self._guilds.clear()
+        else:
+            self._guilds.pop(guild_id, None)
+
+
+class LazyGuildSettings:
+    """
+    GUILD_SETTINGS: a {key: value} dict of settings (such as the log
+    channel) per guild, filled from the store the first time that guild is
+    used. Values are JSON-serializable; setting a value to None removes it.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._guilds = {}
+        self._loaded = False
+
+    def _load_all(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        for guild_id, settings in self._store.load_settings().items():
+            if guild_id not in self._guilds:
+                self._guilds[guild_id] = settings
+
+    def for_guild(self, guild_id):
+        settings = self._guilds.get(guild_id)
+        if settings is not None:
+            return settings
+        if self._store.per_guild:
+            settings = self._store.load_guild_settings(guild_id)
+        else:
+            self._load_all()
+            settings = self._guilds.get(guild_id) or {}
+        self._guilds[guild_id] = settings
+        return settings
+
+    def get(self, guild_id, key, default=None):
+        return self.for_guild(guild_id).get(key, default)
+
+    def set(self, guild_id, key, value):
+        settings = self.for_guild(guild_id)
+        if settings.get(key) == value:
+            return False
+        if value is None:
+            del settings[key]
+        else:
+            settings[key] = value
+        return True
+
+    def items(self):
+        """(guild_id, settings) for every guild, loading all of them."""
+        self._load_all()
+        return self._guilds.items()
+
+    def clear(self):
+        self._loaded = True
+        self._guilds.clear()
+
+    def invalidate(self, guild_id=None):
+        if guild_id is None or not self._store.per_guild:
+            self._loaded = False
+            self._guilds.clear()
+        else:
+            self._guilds.pop(guild_id, None)
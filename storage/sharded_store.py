@@ -0,0 +1,244 @@
+import asyncio
+import os
+import threading
+from contextlib import contextmanager
+from storage.base import ROLE_KINDS, PermissionStore
+from storage.journal import Journal, apply_record, change_record
+from storage.json_store import (
+    dump_principals, dump_roles, parse_permissions, parse_principals, parse_role_entries, parse_roles
+)
+from utils.metrics import metrics
+from utils.persistence import atomic_write_json, read_json
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def dump_sections(sections):
+    return {
+        "permissions": dump_principals(sections.get("permissions", {})),
+        **{kind: dump_roles(sections.get(kind, {})) for kind in ROLE_KINDS},
+        "settings": dict(sections.get("settings", {}))
+    }
+
+
+class ShardedJsonStore(PermissionStore):
+    """
+    One JSON file per guild (<directory>/<guild_id>.json) holding that
+    guild's grants, role managers, role admins and settings.
+
+    Guild files are read when the guild is first used. Each mutation is
+    appended to the guild's journal (<guild_id>.journal) and replayed on
+    top of the snapshot at load. Once a journal holds `compact_every`
+    records, and for every changed guild at shutdown, the snapshot and
+    journal on disk are folded into a fresh snapshot and the journal is
+    archived as <guild_id>.<n>.journal; the newest `journal_history`
+    archives are kept as the guild's change history.
+
+    Every file operation on a guild holds that guild's lock: a thread lock
+    plus, where fcntl is available, a byte-range lock on <directory>/.lock,
+    so several bot processes can share the directory.
+
+    A single-file permissions.json found at `legacy_path` is split into
+    guild files once and renamed to <legacy_path>.migrated.
+    """
+
+    per_guild = True
+
+    def __init__(self, directory, legacy_path=None, compact_every=1000, journal_history=10):
+        self.directory = directory
+        self.compact_every = compact_every
+        self.journal_history = journal_history
+        self._documents = {}
+        self._journals = {}
+        self._thread_locks = {}
+        self._touched = set()
+        self._compacting = set()
+        self._tasks = set()
+        self._state = None
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, ".lock"), "a+b")
+        if legacy_path and os.path.exists(legacy_path):
+            # Another process may be migrating the same file
+            with self._locked(0):
+                if os.path.exists(legacy_path):
+                    self._migrate(legacy_path)
+
+    def _path(self, guild_id):
+        return os.path.join(self.directory, f"{guild_id}.json")
+
+    def _journal(self, guild_id):
+        journal = self._journals.get(guild_id)
+        if journal is None:
+            journal = self._journals[guild_id] = Journal(
+                os.path.join(self.directory, f"{guild_id}.journal"), keep=self.journal_history
+            )
+        return journal
+
+    @contextmanager
+    def _locked(self, guild_id):
+        with self._thread_locks.setdefault(guild_id, threading.Lock()):
+            if fcntl is None:
+                yield
+                return
+            fcntl.lockf(self._lock_file, fcntl.LOCK_EX, 1, guild_id)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_file, fcntl.LOCK_UN, 1, guild_id)
+
+    def guild_ids(self):
+        guild_ids = set()
+        for name in os.listdir(self.directory):
+            stem, _, extension = name.partition(".")
+            if stem.isdigit() and extension in ("json", "journal"):
+                guild_ids.add(int(stem))
+        return sorted(guild_ids)
+
+    def _migrate(self, legacy_path):
+        document = read_json(legacy_path)
+        shards = {}
+        for guild_id, principals in parse_permissions(document).items():
+            shards.setdefault(guild_id, {})["permissions"] = principals
+        for kind in ROLE_KINDS:
+            for guild_id, roles in parse_role_entries(document, kind).items():
+                shards.setdefault(guild_id, {})[kind] = roles
+
+        for guild_id, shard in shards.items():
+            atomic_write_json(self._path(guild_id), dump_sections(shard))
+        os.replace(legacy_path, legacy_path + ".migrated")
+        print(f"Migrated {legacy_path} into {len(shards)} guild files under {self.directory}.")
+
+    def _read_sections(self, guild_id):
+        """The guild's state on disk: snapshot plus journal. Call with the guild lock held."""
+        path = self._path(guild_id)
+        document = read_json(path) if os.path.exists(path) else {}
+        sections = {
+            "permissions": parse_principals(document.get("permissions", {})),
+            **{kind: parse_roles(document.get(kind, {})) for kind in ROLE_KINDS},
+            "settings": document.get("settings", {})
+        }
+        journal = self._journal(guild_id)
+        journal.length = 0
+        for record in journal.records():
+            apply_record(sections, record)
+            journal.length += 1
+        return sections
+
+    def _section(self, guild_id, name):
+        # Each guild is read once and its sections handed out one by one
+        sections = self._documents.get(guild_id)
+        if sections is None:
+            with self._locked(guild_id):
+                sections = self._documents[guild_id] = self._read_sections(guild_id)
+        section = sections.pop(name, {})
+        if not sections:
+            del self._documents[guild_id]
+        return section
+
+    def load_guild(self, guild_id):
+        return self._section(guild_id, "permissions")
+
+    def load_guild_roles(self, kind, guild_id):
+        return self._section(guild_id, kind)
+
+    def load_guild_settings(self, guild_id):
+        return self._section(guild_id, "settings")
+
+    def load_permissions(self):
+        permissions = {}
+        for guild_id in self.guild_ids():
+            principals = self.load_guild(guild_id)
+            if principals:
+                permissions[guild_id] = principals
+        return permissions
+
+    def load_role_entries(self, kind):
+        entries = {}
+        for guild_id in self.guild_ids():
+            roles = self.load_guild_roles(kind, guild_id)
+            if roles:
+                entries[guild_id] = roles
+        return entries
+
+    def load_settings(self):
+        settings = {}
+        for guild_id in self.guild_ids():
+            guild_settings = self.load_guild_settings(guild_id)
+            if guild_settings:
+                settings[guild_id] = guild_settings
+        return settings
+
+    def invalidate(self, guild_id=None):
+        if guild_id is None:
+            self._documents.clear()
+        else:
+            self._documents.pop(guild_id, None)
+
+    def attach(self, permissions, role_managers, role_admins, settings):
+        self._state = (permissions, role_managers, role_admins, settings)
+
+    def _append(self, guild_id, *records):
+        journal = self._journal(guild_id)
+        with self._locked(guild_id):
+            journal.append(*records)
+        self._touched.add(guild_id)
+        if journal.length >= self.compact_every:
+            self._compact_soon(guild_id)
+
+    def _fold(self, guild_id):
+        with metrics.span("permissions.compact"), self._locked(guild_id):
+            atomic_write_json(self._path(guild_id), dump_sections(self._read_sections(guild_id)))
+            self._journal(guild_id).archive()
+
+    def _compact_soon(self, guild_id):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._fold(guild_id)
+            return
+        if guild_id in self._compacting:
+            return
+        self._compacting.add(guild_id)
+        task = loop.create_task(asyncio.to_thread(self._fold, guild_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._compacting.discard(guild_id))
+
+    @metrics.timed("permissions.persist")
+    def commit(self, guild_id, changes):
+        self._append(guild_id, *(change_record(guild_id, op, args) for op, args in changes))
+
+    def compact(self, guild_id=None):
+        """Fold the journal of one guild, or of every guild changed since startup, into its snapshot."""
+        for guild_id in [guild_id] if guild_id is not None else list(self._touched):
+            self._touched.discard(guild_id)
+            self._fold(guild_id)
+
+    def save(self):
+        """
+        Overwrite every guild file from the in-memory state. Only needed
+        after editing the structures directly; writes synchronously.
+        """
+        permissions, role_managers, role_admins, settings = self._state
+        guild_ids = set(permissions.keys())
+        for index in (role_managers, role_admins):
+            guild_ids.update(guild_id for guild_id, roles in index.items() if len(roles))
+        guild_ids.update(guild_id for guild_id, values in settings.items() if values)
+        guild_ids.update(self.guild_ids())
+        for guild_id in guild_ids:
+            snapshot = {
+                "permissions": dump_principals(permissions.get(guild_id, {})),
+                "role_managers": dump_roles(role_managers.for_guild(guild_id)),
+                "role_admins": dump_roles(role_admins.for_guild(guild_id)),
+                "settings": dict(settings.for_guild(guild_id)),
+            }
+            with self._locked(guild_id):
+                atomic_write_json(self._path(guild_id), snapshot)
+                self._journal(guild_id).archive()
+
+    def close(self):
+        self.compact()
+        self._lock_file.close()
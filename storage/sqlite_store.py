@@ -0,0 +1,239 @@
+import json
+import os
+import sqlite3
+from storage.base import LEGACY_GUILD, ROLE_KINDS, PermissionStore
+from storage.json_store import parse_permissions, parse_role_entries
+from utils.metrics import metrics
+from utils.persistence import read_json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS permissions (
+    guild_id INTEGER NOT NULL,
+    principal_id INTEGER NOT NULL,
+    command TEXT NOT NULL,
+    subcommand TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (guild_id, principal_id, command, subcommand)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS permissions_by_principal ON permissions (principal_id, guild_id);
+
+CREATE TABLE IF NOT EXISTS role_managers (
+    role_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    guild_id INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (role_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS role_managers_by_user ON role_managers (user_id);
+
+CREATE TABLE IF NOT EXISTS role_admins (
+    role_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    guild_id INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (role_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS role_admins_by_user ON role_admins (user_id);
+
+CREATE TABLE IF NOT EXISTS guild_settings (
+    guild_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (guild_id, key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Subcommand value stored for a grant of the bare command.
+BARE = ""
+
+
+class SqliteStore(PermissionStore):
+    """
+    SQLite (WAL) backend. Every commit is one SQL transaction touching only
+    the affected rows, so write cost does not grow with the number of guilds.
+
+    On first open, an existing JSON permissions file is imported once.
+    """
+
+    per_guild = True
+
+    def __init__(self, path, json_path=None):
+        self.path = path
+        self.json_path = json_path
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._scope_role_tables()
+        self._migrate_json()
+
+    def _scope_role_tables(self):
+        # Databases created before role entries were scoped per guild lack
+        # the guild_id column; their rows start out under LEGACY_GUILD.
+        for table in ROLE_KINDS:
+            columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if "guild_id" not in columns:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN guild_id INTEGER NOT NULL DEFAULT {LEGACY_GUILD}")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_by_guild ON {table} (guild_id, role_id)")
+
+    def _migrate_json(self):
+        if not self.json_path or not os.path.exists(self.json_path):
+            return
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+
+        document = read_json(self.json_path)
+        permissions = parse_permissions(document)
+
+        with self.conn:
+            # IMMEDIATE so that only one of several starting processes imports the file
+            self.conn.execute("BEGIN IMMEDIATE")
+            if self.conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO permissions VALUES (?, ?, ?, ?)",
+                (
+                    (guild_id, principal_id, command, subcommand)
+                    for guild_id, principals in permissions.items()
+                    for principal_id, commands in principals.items()
+                    for command, subcommands in commands.items()
+                    for subcommand in (subcommands or [BARE])
+                )
+            )
+            for table in ROLE_KINDS:
+                entries = parse_role_entries(document, table)
+                self.conn.executemany(
+                    f"INSERT OR IGNORE INTO {table} (guild_id, role_id, user_id) VALUES (?, ?, ?)",
+                    (
+                        (guild_id, role_id, user_id)
+                        for guild_id, roles in entries.items()
+                        for role_id, users in roles.items()
+                        for user_id in users
+                    )
+                )
+            self.conn.execute(
+                "INSERT INTO meta VALUES ('json_migrated', ?)", (os.path.abspath(self.json_path),)
+            )
+        print(f"Migrated {self.json_path} into {self.path}.")
+
+    def load_permissions(self):
+        permissions = {}
+        rows = self.conn.execute(
+            "SELECT guild_id, principal_id, command, subcommand FROM permissions "
+            "ORDER BY guild_id, principal_id, command, subcommand"
+        )
+        for guild_id, principal_id, command, subcommand in rows:
+            subcommands = permissions.setdefault(guild_id, {}).setdefault(principal_id, {}).setdefault(command, [])
+            if subcommand != BARE:
+                subcommands.append(subcommand)
+        return permissions
+
+    def load_guild(self, guild_id):
+        principals = {}
+        rows = self.conn.execute(
+            "SELECT principal_id, command, subcommand FROM permissions WHERE guild_id = ? "
+            "ORDER BY principal_id, command, subcommand",
+            (guild_id,)
+        )
+        for principal_id, command, subcommand in rows:
+            subcommands = principals.setdefault(principal_id, {}).setdefault(command, [])
+            if subcommand != BARE:
+                subcommands.append(subcommand)
+        return principals
+
+    def load_role_entries(self, kind):
+        if kind not in ROLE_KINDS:
+            raise ValueError(f"Unknown role table '{kind}'")
+        entries = {}
+        for guild_id, role_id, user_id in self.conn.execute(f"SELECT guild_id, role_id, user_id FROM {kind}"):
+            entries.setdefault(guild_id, {}).setdefault(role_id, []).append(user_id)
+        return entries
+
+    def load_guild_roles(self, kind, guild_id):
+        if kind not in ROLE_KINDS:
+            raise ValueError(f"Unknown role table '{kind}'")
+        entries = {}
+        for role_id, user_id in self.conn.execute(f"SELECT role_id, user_id FROM {kind} WHERE guild_id = ?", (guild_id,)):
+            entries.setdefault(role_id, []).append(user_id)
+        return entries
+
+    def load_settings(self):
+        settings = {}
+        for guild_id, key, value in self.conn.execute("SELECT guild_id, key, value FROM guild_settings"):
+            settings.setdefault(guild_id, {})[key] = json.loads(value)
+        return settings
+
+    def load_guild_settings(self, guild_id):
+        return {
+            key: json.loads(value)
+            for key, value in self.conn.execute("SELECT key, value FROM guild_settings WHERE guild_id = ?", (guild_id,))
+        }
+
+    @metrics.timed("permissions.persist")
+    def commit(self, guild_id, changes):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            for op, args in changes:
+                getattr(self, "_" + op)(guild_id, *args)
+
+    def _grant(self, guild_id, principal_id, command, subcommand=None):
+        self.conn.execute(
+            "INSERT OR IGNORE INTO permissions VALUES (?, ?, ?, ?)",
+            (guild_id, principal_id, command, subcommand or BARE)
+        )
+
+    def _revoke(self, guild_id, principal_id, command, subcommand=None):
+        if not subcommand:
+            self.conn.execute(
+                "DELETE FROM permissions WHERE guild_id = ? AND principal_id = ? AND command = ?",
+                (guild_id, principal_id, command)
+            )
+            return
+
+        self.conn.execute(
+            "DELETE FROM permissions WHERE guild_id = ? AND principal_id = ? AND command = ? AND subcommand = ?",
+            (guild_id, principal_id, command, subcommand)
+        )
+        # Removing the last subcommand removes the command, matching the in-memory state.
+        self.conn.execute(
+            "DELETE FROM permissions WHERE guild_id = ? AND principal_id = ? AND command = ? AND subcommand = ? "
+            "AND NOT EXISTS (SELECT 1 FROM permissions WHERE guild_id = ? AND principal_id = ? AND command = ? AND subcommand != ?)",
+            (guild_id, principal_id, command, BARE, guild_id, principal_id, command, BARE)
+        )
+
+    def _add_role_manager(self, guild_id, role_id, user_id):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO role_managers (guild_id, role_id, user_id) VALUES (?, ?, ?)",
+            (guild_id, role_id, user_id)
+        )
+
+    def _remove_role_manager(self, guild_id, role_id, user_id):
+        self.conn.execute(
+            "DELETE FROM role_managers WHERE guild_id = ? AND role_id = ? AND user_id = ?",
+            (guild_id, role_id, user_id)
+        )
+
+    def _add_role_admin(self, guild_id, role_id, user_id):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO role_admins (guild_id, role_id, user_id) VALUES (?, ?, ?)",
+            (guild_id, role_id, user_id)
+        )
+
+    def _remove_role_admin(self, guild_id, role_id, user_id):
+        self.conn.execute(
+            "DELETE FROM role_admins WHERE guild_id = ? AND role_id = ? AND user_id = ?",
+            (guild_id, role_id, user_id)
+        )
+
+    def _set_setting(self, guild_id, key, value):
+        if value is None:
+            self.conn.execute("DELETE FROM guild_settings WHERE guild_id = ? AND key = ?", (guild_id, key))
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO guild_settings VALUES (?, ?, ?)", (guild_id, key, json.dumps(value))
+        )
+
+    def close(self):
+        self.conn.close()
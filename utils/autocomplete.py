@@ -1,10 +1,10 @@
 from discord import app_commands
 import discord
+from utils.role_search import role_search
 
 async def role_autocomplete(interaction: discord.Interaction, current: str):
     try:
-        roles = [r for r in interaction.guild.roles if current.lower() in r.name.lower()]
-        return [app_commands.Choice(name=r.name, value=r.name) for r in roles[:25]]
+        return role_search.search(interaction.guild, current)
     except discord.errors.NotFound:
         print("Autocomplete interaction was not found (likely expired).")
         return []
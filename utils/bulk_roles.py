@@ -0,0 +1,251 @@
+import asyncio
+import json
+import os
+import secrets
+import time
+import discord
+from utils.persistence import atomic_write_json
+from utils.metrics import metrics
+
+# cluster.py gives each process its own file, since jobs run where their guild's shard runs
+BULK_JOBS_FILE = os.environ.get("BULK_JOBS_FILE", "bulk_jobs.json")
+# Members fetched and processed between checkpoints
+CHUNK_SIZE = 1000
+# Concurrent role edits per job
+WORKERS = int(os.environ.get("BULK_ROLE_WORKERS", "4"))
+# Role edits per second per guild, on top of discord.py's own bucket handling
+RATE = float(os.environ.get("BULK_ROLE_RATE", "5"))
+PROGRESS_INTERVAL = 3.0
+
+
+class GuildPacer:
+    """Spaces out role edits within one guild so a job stays under the member-role bucket."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+class BulkRoleJob:
+    def __init__(self, guild_id, action, role_id, filter_role_id=None, requested_by=None, job_id=None):
+        self.id = job_id or secrets.token_hex(4)
+        self.guild_id = guild_id
+        self.action = action
+        self.role_id = role_id
+        self.filter_role_id = filter_role_id
+        self.requested_by = requested_by
+        self.cursor = 0
+        self.scanned = 0
+        self.changed = 0
+        self.failed = 0
+        self.status = "pending"
+        self.cancel_requested = False
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "guild_id": self.guild_id,
+            "action": self.action,
+            "role_id": self.role_id,
+            "filter_role_id": self.filter_role_id,
+            "requested_by": self.requested_by,
+            "cursor": self.cursor,
+            "scanned": self.scanned,
+            "changed": self.changed,
+            "failed": self.failed,
+            "status": self.status,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(
+            data["guild_id"], data["action"], data["role_id"],
+            data.get("filter_role_id"), data.get("requested_by"), job_id=data["id"]
+        )
+        job.cursor = data.get("cursor", 0)
+        job.scanned = data.get("scanned", 0)
+        job.changed = data.get("changed", 0)
+        job.failed = data.get("failed", 0)
+        job.status = data.get("status", "pending")
+        # A job that was running when the bot stopped can be resumed from its cursor
+        if job.status == "running":
+            job.status = "interrupted"
+        return job
+
+    def wants(self, member: discord.Member):
+        role_ids = {role.id for role in member.roles}
+        if self.filter_role_id and self.filter_role_id not in role_ids:
+            return False
+        has_role = self.role_id in role_ids
+        return not has_role if self.action == "add" else has_role
+
+    def progress(self):
+        verb = "Adding" if self.action == "add" else "Removing"
+        return (
+            f"{verb} <@&{self.role_id}> — job `{self.id}` is **{self.status}**\n"
+            f"Scanned {self.scanned} members, changed {self.changed}, failed {self.failed}."
+        )
+
+
+class BulkRoleManager:
+    """
+    Runs bulk role jobs: members are streamed from the API in chunks, the
+    ones that need the change go through a bounded worker pool, and the job
+    cursor (last member id of a finished chunk) is persisted after every
+    chunk so an interrupted or cancelled job can resume where it stopped.
+    """
+
+    def __init__(self, storage_file=BULK_JOBS_FILE):
+        self.storage_file = storage_file
+        self.jobs = {}
+        self._tasks = {}
+        self._pacers = {}
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.storage_file):
+            with open(self.storage_file, "r") as f:
+                for data in json.load(f):
+                    job = BulkRoleJob.from_dict(data)
+                    self.jobs[job.id] = job
+
+    def _save(self):
+        atomic_write_json(self.storage_file, [job.to_dict() for job in self.jobs.values()])
+
+    def create(self, guild_id, action, role_id, filter_role_id=None, requested_by=None):
+        job = BulkRoleJob(guild_id, action, role_id, filter_role_id, requested_by)
+        self.jobs[job.id] = job
+        self._save()
+        return job
+
+    def get(self, guild_id, job_id):
+        job = self.jobs.get(job_id)
+        return job if job and job.guild_id == guild_id else None
+
+    def is_running(self, job_id):
+        task = self._tasks.get(job_id)
+        return task is not None and not task.done()
+
+    def cancel(self, job):
+        job.cancel_requested = True
+        if not self.is_running(job.id):
+            job.status = "cancelled"
+            self._save()
+
+    def _pacer(self, guild_id):
+        pacer = self._pacers.get(guild_id)
+        if pacer is None:
+            pacer = self._pacers[guild_id] = GuildPacer(RATE)
+        return pacer
+
+    async def run(self, job, guild: discord.Guild, reason, on_progress=None, on_chunk=None):
+        """
+        Process `job` until every member has been scanned or it is cancelled.
+        on_progress(job) is awaited at most every PROGRESS_INTERVAL seconds,
+        on_chunk(job, changed_in_chunk) after each checkpoint.
+        """
+        if self.is_running(job.id):
+            raise RuntimeError(f"Job {job.id} is already running")
+        self._tasks[job.id] = asyncio.current_task()
+
+        role = guild.get_role(job.role_id)
+        if role is None:
+            job.status = "failed"
+            self._save()
+            return job
+
+        job.status = "running"
+        job.cancel_requested = False
+        self._save()
+
+        queue = asyncio.Queue(maxsize=WORKERS * 2)
+        pacer = self._pacer(guild.id)
+        chunk_changed = [0]
+
+        async def worker():
+            while True:
+                member = await queue.get()
+                try:
+                    if not job.cancel_requested:
+                        await pacer.wait()
+                        with metrics.span("discord.edit_member_roles", source="bulk"):
+                            if job.action == "add":
+                                await member.add_roles(role, reason=reason)
+                            else:
+                                await member.remove_roles(role, reason=reason)
+                        job.changed += 1
+                        chunk_changed[0] += 1
+                except Exception as e:
+                    # Not only HTTPException: a dropped connection must not kill the worker,
+                    # or the queue stops draining and the job hangs
+                    job.failed += 1
+                    print(f"Bulk job {job.id}: failed to update member {member.id}: {e!r}")
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(WORKERS)]
+        last_report = 0.0
+        try:
+            if job.cursor:
+                members = guild.fetch_members(limit=None, after=discord.Object(id=job.cursor))
+            else:
+                members = guild.fetch_members(limit=None)
+            chunk_last_id = None
+            chunk_size = 0
+            async for member in members:
+                if job.cancel_requested:
+                    break
+                job.scanned += 1
+                chunk_size += 1
+                chunk_last_id = member.id
+                if job.wants(member):
+                    await queue.put(member)
+
+                if chunk_size >= CHUNK_SIZE:
+                    await self._checkpoint(job, queue, chunk_last_id, chunk_changed, on_chunk)
+                    chunk_size = 0
+
+                if on_progress and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    await on_progress(job)
+
+            if chunk_size:
+                await self._checkpoint(job, queue, chunk_last_id, chunk_changed, on_chunk)
+            job.status = "cancelled" if job.cancel_requested else "done"
+        except Exception as e:
+            job.status = "interrupted"
+            print(f"Bulk job {job.id} stopped: {e!r}")
+        finally:
+            for task in workers:
+                task.cancel()
+            self._tasks.pop(job.id, None)
+            self._save()
+
+        if on_progress:
+            await on_progress(job)
+        return job
+
+    async def _checkpoint(self, job, queue, last_id, chunk_changed, on_chunk):
+        await queue.join()
+        # On cancel the queue is drained without applying, so the chunk is not complete
+        if job.cancel_requested:
+            return
+        job.cursor = last_id
+        self._save()
+        if on_chunk:
+            await on_chunk(job, chunk_changed[0])
+        chunk_changed[0] = 0
+
+
+bulk_roles = BulkRoleManager()
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import os
+from utils.metrics import metrics
+
+RECONNECT_DELAY = 1.0
+
+
+class ClusterHub:
+    """
+    Unix socket server run by cluster.py. Every newline-delimited message a
+    bot process sends is relayed to all the other connected processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._writers = set()
+        self._server = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, self.path)
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while line := await reader.readline():
+                for other in list(self._writers):
+                    if other is not writer:
+                        other.write(line)
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+        # Closing the connections ends every _handle loop
+        for writer in list(self._writers):
+            writer.close()
+            await writer.wait_closed()
+        if self._server is not None:
+            await self._server.wait_closed()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class ClusterLink:
+    """
+    A bot process's connection to the ClusterHub.
+
+    publish() sends a message to every other process; handlers registered
+    with on() receive the messages of that type. While disconnected,
+    messages are dropped, so handlers registered with on_connect() run after
+    every (re)connect to resynchronize anything that may have been missed.
+    Until start() is called, publish() does nothing, which is the
+    single-process case.
+    """
+
+    def __init__(self):
+        self.cluster_id = None
+        self._handlers = {}
+        self._connect_handlers = []
+        self._writer = None
+        self._task = None
+
+    def on(self, message_type, handler):
+        self._handlers[message_type] = handler
+
+    def on_connect(self, handler):
+        self._connect_handlers.append(handler)
+
+    async def start(self, path, cluster_id):
+        self.cluster_id = cluster_id
+        self._task = asyncio.get_running_loop().create_task(self._run(path))
+
+    def publish(self, message_type, **payload):
+        if self._writer is None:
+            if self._task is not None:
+                metrics.inc("cluster_messages_total", direction="dropped", type=message_type)
+            return
+        message = {"type": message_type, "from": self.cluster_id, **payload}
+        self._writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+        metrics.inc("cluster_messages_total", direction="sent", type=message_type)
+
+    async def _run(self, path):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(path)
+            except OSError as e:
+                print(f"Cluster hub at {path} unavailable: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            self._writer = writer
+            for handler in self._connect_handlers:
+                handler()
+            try:
+                while line := await reader.readline():
+                    self._dispatch(line)
+            except ConnectionError:
+                pass
+            finally:
+                self._writer = None
+                writer.close()
+            print(f"Lost connection to the cluster hub at {path}; reconnecting.")
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def _dispatch(self, line):
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return
+        message_type = message.get("type")
+        metrics.inc("cluster_messages_total", direction="received", type=message_type)
+        handler = self._handlers.get(message_type)
+        if handler is None:
+            return
+        try:
+            handler(message)
+        except Exception as e:
+            print(f"Error handling cluster message {message_type}: {e}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+cluster_link = ClusterLink()
@@ -0,0 +1,87 @@
+import bisect
+import discord
+from discord import app_commands
+
+MAX_CHOICES = 25
+MAX_CACHED_QUERIES = 512
+
+
+class CommandCatalog:
+    """
+    Every token /perms can grant: top-level commands, group subcommands
+    ("role create"), Discord permission flags and "*".
+
+    Built once from the command tree and rebuilt only when the set of
+    command names changes. Lookups bisect a sorted token list for prefix
+    matches and reuse cached Choice objects.
+    """
+
+    def __init__(self):
+        self._signature = None
+        self._tokens = []
+        self._ordered = []
+        self._choices = {}
+        self._cache = {}
+
+    def _tree_signature(self, tree):
+        return tuple(sorted(
+            command.qualified_name
+            for command in tree.walk_commands()
+        ))
+
+    def refresh(self, tree):
+        signature = self._tree_signature(tree)
+        if signature == self._signature:
+            return False
+
+        commands = [name for name in signature if " " not in name]
+        subcommands = [name for name in signature if " " in name]
+        flags = sorted(discord.Permissions.VALID_FLAGS)
+
+        # Order used for substring matches and the empty query
+        self._ordered = commands + subcommands + flags + ["*"]
+        self._tokens = sorted((token.lower(), token) for token in self._ordered)
+        self._choices = {token: app_commands.Choice(name=token, value=token) for token in self._ordered}
+        self._cache.clear()
+        self._signature = signature
+        return True
+
+    def ensure(self, tree):
+        if self._signature is None:
+            self.refresh(tree)
+
+    def __contains__(self, token):
+        return token in self._choices
+
+    def search(self, current, limit=MAX_CHOICES):
+        query = current.lower()
+        cached = self._cache.get(query)
+        if cached is not None:
+            return cached
+
+        if not query:
+            return [self._choices[token] for token in self._ordered[:limit]]
+
+        start = bisect.bisect_left(self._tokens, (query,))
+        matches = []
+        for lowered, token in self._tokens[start:]:
+            if not lowered.startswith(query) or len(matches) == limit:
+                break
+            matches.append(token)
+
+        if len(matches) < limit:
+            seen = set(matches)
+            for token in self._ordered:
+                if token not in seen and query in token.lower():
+                    matches.append(token)
+                    if len(matches) == limit:
+                        break
+
+        result = [self._choices[token] for token in matches]
+        if len(self._cache) >= MAX_CACHED_QUERIES:
+            self._cache.clear()
+        self._cache[query] = result
+        return result
+
+
+command_catalog = CommandCatalog()
@@ -1,51 +1,236 @@
+import asyncio
 import discord
 import json
 import os
+from config import AUDIT_STORE, GUILD_SETTINGS
+from utils.metrics import metrics
+from utils.permissions import permission_transaction
+
+# Discord accepts at most 10 embeds and 6000 embed characters per message.
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+MAX_SEND_ATTEMPTS = 5
+
+# GUILD_SETTINGS key of a guild's log channel
+LOG_CHANNEL = "log_channel"
+WEBHOOK_NAME = "MiniAce Logs"
+
+def _mentioned_id(value):
+    """The ID in a user/role mention or bare ID, or None."""
+    text = str(value).strip("<@!&>")
+    return int(text) if text.isdigit() else None
+
+class WebhookPool:
+    """
+    Where log embeds are sent, per channel: a webhook named WEBHOOK_NAME,
+    found or created on first use, so log traffic is rate limited per
+    webhook instead of using the bot's own message buckets. Without the
+    Manage Webhooks permission the channel itself is used. Channels and
+    destinations are cached until forget() (channel deleted or its
+    webhooks changed).
+    """
+
+    def __init__(self):
+        self._channels = {}
+        self._destinations = {}
+        self._lock = asyncio.Lock()
+
+    def channel(self, bot: discord.Client, channel_id):
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            channel = bot.get_channel(channel_id)
+            if channel is not None:
+                self._channels[channel_id] = channel
+        return channel
+
+    async def destination(self, channel):
+        destination = self._destinations.get(channel.id)
+        if destination is not None:
+            return destination
+        # One lookup per channel even when several batches arrive at once
+        async with self._lock:
+            destination = self._destinations.get(channel.id)
+            if destination is None:
+                destination = self._destinations[channel.id] = await self._find_or_create(channel)
+        return destination
+
+    async def _find_or_create(self, channel):
+        try:
+            with metrics.span("discord.webhook_lookup"):
+                for webhook in await channel.webhooks():
+                    if webhook.name == WEBHOOK_NAME and webhook.token:
+                        return webhook
+                return await channel.create_webhook(name=WEBHOOK_NAME, reason="Audit log delivery")
+        except discord.HTTPException as e:
+            print(f"Cannot use a webhook in #{channel} ({e}); sending logs as the bot instead.")
+            return channel
+
+    def forget(self, channel_id):
+        self._channels.pop(channel_id, None)
+        self._destinations.pop(channel_id, None)
+
+webhook_pool = WebhookPool()
 
 class Logger:
-    def __init__(self, storage_file="log_channel.json"):
-        self.log_channel = None
+    """
+    Sends audit log embeds to each guild's log channel (GUILD_SETTINGS,
+    set with /setlogchannel) through webhook_pool, and records every event
+    in the local audit store.
+
+    `storage_file` is the single global log channel used before channels
+    were set per guild; claim_legacy_channel() moves it into its guild.
+    """
+
+    def __init__(self, storage_file="log_channel.json", flush_interval=2.0, audit_store=AUDIT_STORE):
         self.storage_file = storage_file
-        self._load_channel()
+        self.flush_interval = flush_interval
+        self.audit_store = audit_store
+        self._queue = None
+        self._worker = None
 
-    def _load_channel(self):
-        if os.path.exists(self.storage_file):
-            with open(self.storage_file, "r") as f:
-                data = json.load(f)
-                self.log_channel = data.get("channel_id")
+    def channel_id(self, guild_id):
+        return GUILD_SETTINGS.get(guild_id, LOG_CHANNEL)
 
-    def _save_channel(self, channel_id):
-        with open(self.storage_file, "w") as f:
-            json.dump({"channel_id": channel_id}, f)
+    async def set_channel(self, channel: discord.TextChannel):
+        async with permission_transaction(channel.guild.id) as txn:
+            txn.set_setting(LOG_CHANNEL, channel.id)
 
-    def set_channel(self, channel: discord.TextChannel):
-        self.log_channel = channel.id
-        self._save_channel(channel.id)
+    async def forget_channel(self, channel):
+        """Drop a deleted channel from the caches and stop logging to it."""
+        webhook_pool.forget(channel.id)
+        async with permission_transaction(channel.guild.id) as txn:
+            if self.channel_id(channel.guild.id) == channel.id:
+                txn.set_setting(LOG_CHANNEL, None)
 
-    async def log(self, bot: discord.Client, interaction: discord.Interaction, **kwargs):
-        if not self.log_channel:
-            print("Log channel is not set. Please configure it using /setlogchannel.")
+    async def claim_legacy_channel(self, bot: discord.Client):
+        if not os.path.exists(self.storage_file):
             return
+        with open(self.storage_file, "r") as f:
+            channel_id = json.load(f).get("channel_id")
+        channel = bot.get_channel(channel_id) if channel_id else None
+        if channel is None:
+            # Possibly a guild run by another cluster process; it claims the file instead
+            return
+        async with permission_transaction(channel.guild.id) as txn:
+            if self.channel_id(channel.guild.id) is None:
+                txn.set_setting(LOG_CHANNEL, channel.id)
+        os.replace(self.storage_file, self.storage_file + ".migrated")
+        print(f"Moved the log channel in {self.storage_file} to guild {channel.guild.id}.")
+
+    def _enqueue(self, bot: discord.Client, guild_id, embed: discord.Embed):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._dispatch())
+        self._queue.put_nowait((bot, guild_id, embed))
+
+    async def _dispatch(self):
+        """
+        Drain the queue in per-guild batches: a guild's batch is sent as
+        soon as it holds MAX_EMBEDS_PER_MESSAGE embeds, and every batch
+        still open is sent flush_interval seconds after the first embed of
+        the round arrived. A None item flushes everything and stops the
+        worker.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batches = {}
+            deadline = loop.time() + self.flush_interval
+            while item is not None:
+                await self._add(batches, *item)
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            for guild_id, (bot, embeds, _) in batches.items():
+                await self._send(bot, guild_id, embeds)
+            if item is None:
+                return
+
+    async def _add(self, batches, bot, guild_id, embed):
+        _, batch, size = batches.get(guild_id, (bot, [], 0))
+        if batch and size + len(embed) > MAX_EMBED_CHARS_PER_MESSAGE:
+            await self._send(bot, guild_id, batch)
+            batch, size = [], 0
+        batch.append(embed)
+        size += len(embed)
+        if len(batch) >= MAX_EMBEDS_PER_MESSAGE:
+            batches.pop(guild_id, None)
+            await self._send(bot, guild_id, batch)
+        else:
+            batches[guild_id] = (bot, batch, size)
 
-        channel = bot.get_channel(self.log_channel)
+    async def _send(self, bot: discord.Client, guild_id, embeds):
+        channel_id = self.channel_id(guild_id)
+        channel = webhook_pool.channel(bot, channel_id) if channel_id else None
         if not channel:
-            print(f"Log channel with ID {self.log_channel} not found. Please verify the channel ID in log_channel.json.")
+            print(f"Log channel {channel_id} of guild {guild_id} not found. Set it again with /setlogchannel.")
+            return
+
+        delay = 1.0
+        for _ in range(MAX_SEND_ATTEMPTS):
+            destination = await webhook_pool.destination(channel)
+            try:
+                with metrics.span("logger.send"):
+                    await destination.send(embeds=embeds)
+                metrics.inc("log_embeds_total", len(embeds))
+                return
+            except discord.NotFound:
+                if destination is channel:
+                    print(f"Log channel {channel_id} of guild {guild_id} no longer exists.")
+                    return
+                # The webhook was deleted; look it up again
+                webhook_pool.forget(channel.id)
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    print(f"Failed to send {len(embeds)} log embeds: {e}")
+                    return
+                retry_after = getattr(e, "retry_after", None)
+                await asyncio.sleep(retry_after or delay)
+                delay = min(delay * 2, 30.0)
+        print(f"Dropped {len(embeds)} log embeds after {MAX_SEND_ATTEMPTS} attempts.")
+
+    async def flush(self):
+        """Send everything still queued and stop the worker. Call before the bot disconnects."""
+        if self._worker is None or self._worker.done():
+            return
+        self._queue.put_nowait(None)
+        await self._worker
+        self._worker = None
+
+    @metrics.timed("logger.log")
+    async def log(self, bot: discord.Client, interaction: discord.Interaction, **kwargs):
+        details = {key: value for key, value in kwargs.items() if key != "Action"}
+        target = kwargs.get("TargetID") or kwargs.get("RoleID") or kwargs.get("RoleName")
+        self.audit_store.record(
+            interaction.guild.id, interaction.user.id, kwargs.get("Action", "Unknown"),
+            _mentioned_id(target) if target is not None else None, User=interaction.user, **details
+        )
+
+        if not self.channel_id(interaction.guild.id):
+            print(f"Log channel of guild {interaction.guild.id} is not set. Please configure it using /setlogchannel.")
             return
 
         embed = discord.Embed(title="Role Command Log", color=discord.Color.blue())
         embed.add_field(name="Command User", value=f"{interaction.user} ({interaction.user.id})", inline=False)
         for key, value in kwargs.items():
             embed.add_field(name=key, value=value, inline=False)
-        await channel.send(embed=embed)
+        self._enqueue(bot, interaction.guild.id, embed)
 
+    @metrics.timed("logger.log")
     async def log_perms_command(self, bot: discord.Client, interaction: discord.Interaction, action: str, target: str, command: str, subcommand: str = None):
-        if not self.log_channel:
-            print("Log channel is not set. Please configure it using /setlogchannel.")
-            return
+        self.audit_store.record(
+            interaction.guild.id, interaction.user.id, f"Perms {action}", _mentioned_id(target),
+            User=interaction.user, Target=target, Command=command, Subcommand=subcommand
+        )
 
-        channel = bot.get_channel(self.log_channel)
-        if not channel:
-            print(f"Log channel with ID {self.log_channel} not found. Please verify the channel ID in log_channel.json.")
+        if not self.channel_id(interaction.guild.id):
+            print(f"Log channel of guild {interaction.guild.id} is not set. Please configure it using /setlogchannel.")
             return
 
         embed = discord.Embed(title="Permissions Command Log", color=discord.Color.green())
@@ -55,4 +240,4 @@ class Logger:
         if subcommand:
             embed.add_field(name="Subcommand", value=subcommand, inline=False)
         embed.add_field(name="Executed By", value=f"{interaction.user} ({interaction.user.id})", inline=False)
-        await channel.send(embed=embed)
+        self._enqueue(bot, interaction.guild.id, embed)
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import discord
+from config import MEMBER_CACHE_SIZE
+from utils.metrics import metrics
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None where unavailable."""
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class MemberCache:
+    """
+    Member lookups for the low-memory mode (MEMBER_CACHE_SIZE > 0), where
+    discord.py caches no members and guilds are not chunked at startup.
+
+    The members seen in interactions and fetched on demand are kept in an
+    LRU of at most `capacity` entries across all guilds. get() checks
+    discord.py's own cache first, so with capacity 0 (the normal member
+    cache) it is guild.get_member(); fetch() falls back to the API.
+    """
+
+    def __init__(self, capacity=0):
+        self.capacity = capacity
+        self._members = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.evictions = 0
+        metrics.gauge("member_cache_size", lambda: len(self._members))
+
+    def remember(self, member):
+        if not self.capacity or not isinstance(member, discord.Member):
+            return
+        key = (member.guild.id, member.id)
+        self._members[key] = member
+        self._members.move_to_end(key)
+        if len(self._members) > self.capacity:
+            self._members.popitem(last=False)
+            self.evictions += 1
+            metrics.inc("member_cache_total", result="evicted")
+
+    def forget(self, guild_id, member_id):
+        self._members.pop((guild_id, member_id), None)
+
+    def forget_guild(self, guild_id):
+        for key in [key for key in self._members if key[0] == guild_id]:
+            del self._members[key]
+
+    def get(self, guild, member_id):
+        member = guild.get_member(member_id)
+        if member is None and self.capacity:
+            key = (guild.id, member_id)
+            member = self._members.get(key)
+            if member is not None:
+                self._members.move_to_end(key)
+        if member is None:
+            self.misses += 1
+            metrics.inc("member_cache_total", result="miss")
+        else:
+            self.hits += 1
+            metrics.inc("member_cache_total", result="hit")
+        return member
+
+    async def fetch(self, guild, member_id):
+        """The member from the caches or the API, or None if they are not in the guild."""
+        member = self.get(guild, member_id)
+        if member is not None:
+            return member
+        self.fetches += 1
+        metrics.inc("member_cache_total", result="fetch")
+        try:
+            with metrics.span("discord.fetch_member"):
+                member = await guild.fetch_member(member_id)
+        except discord.NotFound:
+            return None
+        self.remember(member)
+        return member
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._members),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "fetches": self.fetches,
+            "evictions": self.evictions,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+member_cache = MemberCache(MEMBER_CACHE_SIZE)
+if resource is not None:
+    metrics.gauge("peak_rss_mib", peak_rss_mb)
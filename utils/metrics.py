@@ -0,0 +1,216 @@
+import asyncio
+import bisect
+import functools
+import itertools
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, roughly log-spaced from 100us to 30s
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return BUCKETS[-1]
+
+
+class Metrics:
+    """
+    In-process latency histograms, counters and gauges.
+
+    Everything is recorded under a metric name plus a sorted tuple of label
+    pairs; render_prometheus() exposes them in the Prometheus text format.
+    Gauges are callbacks read at render time.
+    """
+
+    def __init__(self, namespace="miniace"):
+        self.namespace = namespace
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self._server = None
+
+    def observe(self, metric, value, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, metric, amount=1, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, metric, callback, **labels):
+        self.gauges[(metric, tuple(sorted(labels.items())))] = callback
+
+    @contextmanager
+    def span(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("span_seconds", time.perf_counter() - start, span=name, **labels)
+
+    def timed(self, name, sample_every=1):
+        """
+        Decorator recording each call of a sync or async function as a span.
+        With sample_every=N only every Nth call is timed, for paths so hot
+        that a span per call would be a noticeable share of their cost.
+        """
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            if sample_every > 1:
+                calls = itertools.count()
+
+                @functools.wraps(func)
+                def sampled_wrapper(*args, **kwargs):
+                    if next(calls) % sample_every:
+                        return func(*args, **kwargs)
+                    with self.span(name):
+                        return func(*args, **kwargs)
+                return sampled_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def instrument_tree(self, tree):
+        """Wrap every slash command callback with a latency histogram and outcome counter."""
+        # Imported here so that storage backends can use metrics without pulling in discord
+        from discord import app_commands
+
+        for command in tree.walk_commands():
+            if not isinstance(command, app_commands.Command) or getattr(command._callback, "__instrumented__", False):
+                continue
+            command._callback = self._wrap_command(command.qualified_name, command._callback)
+
+    def _wrap_command(self, name, callback):
+        @functools.wraps(callback)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "ok"
+            try:
+                return await callback(*args, **kwargs)
+            except BaseException:
+                outcome = "error"
+                raise
+            finally:
+                self.observe("command_seconds", time.perf_counter() - start, command=name)
+                self.inc("command_total", command=name, outcome=outcome)
+        wrapper.__instrumented__ = True
+        return wrapper
+
+    def summary(self, metric):
+        """Rows of (labels, count, p50, p95, p99) for one histogram metric, busiest first."""
+        rows = [
+            (dict(labels), histogram.count, histogram.quantile(0.5), histogram.quantile(0.95), histogram.quantile(0.99))
+            for (name, labels), histogram in self.histograms.items()
+            if name == metric
+        ]
+        return sorted(rows, key=lambda row: row[1], reverse=True)
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = ",".join(
+            f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+            for key, value in pairs
+        )
+        return "{" + escaped + "}"
+
+    def render_prometheus(self):
+        lines = []
+        seen = set()
+        for (metric, labels), value in sorted(self.counters.items()):
+            name = f"{self.namespace}_{metric}"
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{self._labels(labels)} {value}")
+
+        for (metric, labels), callback in sorted(self.gauges.items(), key=lambda item: item[0]):
+            name = f"{self.namespace}_{metric}"
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{self._labels(labels)} {callback()}")
+
+        for (metric, labels), histogram in sorted(self.histograms.items()):
+            name = f"{self.namespace}_{metric}"
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, histogram.counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {histogram.count}")
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    async def _handle_http(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                body = self.render_prometheus().encode()
+                status = "200 OK"
+            else:
+                body = b"Not Found\n"
+                status = "404 Not Found"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def start_http_server(self, host, port):
+        """Serve GET /metrics in Prometheus text format on host:port."""
+        self._server = await asyncio.start_server(self._handle_http, host, port)
+        print(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+
+
+metrics = Metrics()
@@ -0,0 +1,223 @@
+class PermissionIndex:
+    """
+    Compiled view of PERMISSIONS used by has_permission.
+
+    Each guild is compiled once into a set of principals holding "*" and a
+    map of (principal_id, command) -> frozenset of lowercased subcommands,
+    plus the inverse (command, subcommand or None) -> principals used by
+    holders(). Mutations patch a single principal through refresh() instead
+    of recompiling the whole guild.
+    """
+
+    def __init__(self, permissions):
+        self._permissions = permissions
+        self._masters = {}
+        self._grants = {}
+        self._keys = {}
+        self._holders = {}
+
+    def rebuild(self, guild_id=None):
+        if guild_id is None:
+            self._masters.clear()
+            self._grants.clear()
+            self._keys.clear()
+            self._holders.clear()
+            return
+        self._masters.pop(guild_id, None)
+        self._grants.pop(guild_id, None)
+        self._keys.pop(guild_id, None)
+        self._holders.pop(guild_id, None)
+
+    def refresh(self, guild_id, principal_id):
+        if guild_id not in self._grants:
+            return
+
+        grants = self._grants[guild_id]
+        keys = self._keys[guild_id]
+        holders = self._holders[guild_id]
+        for key in keys.pop(principal_id, ()):
+            command = key[1]
+            for holder_key in [(command, None), *((command, sc) for sc in grants.pop(key, ()))]:
+                principals = holders.get(holder_key)
+                if principals is not None:
+                    principals.discard(principal_id)
+                    if not principals:
+                        del holders[holder_key]
+        self._masters[guild_id].discard(principal_id)
+
+        commands = self._permissions.get(guild_id, {}).get(principal_id)
+        if commands:
+            self._compile_principal(guild_id, principal_id, commands)
+
+    def _ensure(self, guild_id):
+        if guild_id not in self._grants:
+            if guild_id not in self._permissions:
+                return False
+            self._compile_guild(guild_id)
+        return True
+
+    def check(self, guild_id, principal_ids, command, subcommand=None):
+        if not self._ensure(guild_id):
+            return False
+
+        if not self._masters[guild_id].isdisjoint(principal_ids):
+            return True
+
+        grants = self._grants[guild_id]
+        for principal_id in principal_ids:
+            subcommands = grants.get((principal_id, command))
+            if subcommands is not None and (not subcommand or subcommand in subcommands):
+                return True
+        return False
+
+    def masters(self, guild_id):
+        """Principals holding "*" in the guild."""
+        return frozenset(self._masters[guild_id]) if self._ensure(guild_id) else frozenset()
+
+    def holders(self, guild_id, command, subcommand=None):
+        """Principals whose own grants pass check() for (command, subcommand), "*" holders excluded."""
+        if not self._ensure(guild_id):
+            return frozenset()
+        return frozenset(self._holders[guild_id].get((command, subcommand or None), ()))
+
+    def holder_items(self, guild_id):
+        """((command, subcommand or None), principals) for every granted key in the guild."""
+        if not self._ensure(guild_id):
+            return []
+        return [(key, frozenset(principals)) for key, principals in self._holders[guild_id].items()]
+
+    def _compile_guild(self, guild_id):
+        self._masters[guild_id] = set()
+        self._grants[guild_id] = {}
+        self._keys[guild_id] = {}
+        self._holders[guild_id] = {}
+        for principal_id, commands in self._permissions[guild_id].items():
+            if commands:
+                self._compile_principal(guild_id, principal_id, commands)
+
+    def _compile_principal(self, guild_id, principal_id, commands):
+        if "*" in commands:
+            self._masters[guild_id].add(principal_id)
+
+        grants = self._grants[guild_id]
+        holders = self._holders[guild_id]
+        keys = set()
+        for command, subcommands in commands.items():
+            key = (principal_id, command.lower())
+            normalized = frozenset(sc.lower() for sc in subcommands)
+            grants[key] = grants[key] | normalized if key in grants else normalized
+            keys.add(key)
+            for holder_key in [(key[1], None), *((key[1], sc) for sc in normalized)]:
+                holders.setdefault(holder_key, set()).add(principal_id)
+        self._keys[guild_id][principal_id] = keys
+
+
+# Key of "*" grants in HierarchyClosure
+MASTER = ("*", None)
+
+
+class _GuildClosure:
+    __slots__ = ("positions", "granting", "minimum", "keys")
+
+    def __init__(self, positions):
+        self.positions = positions
+        # key -> {role_id: position} of the roles granting it
+        self.granting = {}
+        # key -> lowest position in granting[key]
+        self.minimum = {}
+        # role_id -> keys it grants
+        self.keys = {}
+
+
+class HierarchyClosure:
+    """
+    Opt-in role inheritance (PERMISSIONS_INHERIT): a grant held by a role
+    also applies to every role ranked above it.
+
+    Each guild is compiled once from its roles and PERMISSIONS into the
+    lowest position of a role granting each (command, subcommand) key, with
+    subcommand None meaning any grant of the command. A member passes when
+    their top role's position is at or above that minimum, so a check is a
+    dict lookup and a comparison. Grant changes and role position changes
+    only recompute the keys of the role involved.
+    """
+
+    def __init__(self, permissions):
+        self._permissions = permissions
+        self._guilds = {}
+
+    def rebuild(self, guild_id=None):
+        if guild_id is None:
+            self._guilds.clear()
+        else:
+            self._guilds.pop(guild_id, None)
+
+    forget_guild = rebuild
+
+    def check(self, guild, top_position, command, subcommand=None):
+        closure = self._guilds.get(guild.id)
+        if closure is None:
+            if guild.id not in self._permissions:
+                return False
+            closure = self._compile(guild)
+
+        minimum = closure.minimum
+        if MASTER in minimum and top_position >= minimum[MASTER]:
+            return True
+        position = minimum.get((command, subcommand or None))
+        return position is not None and top_position >= position
+
+    def refresh(self, guild_id, principal_id):
+        closure = self._guilds.get(guild_id)
+        if closure is not None and principal_id in closure.positions:
+            self._update_role(guild_id, closure, principal_id)
+
+    def on_role_create(self, role):
+        closure = self._guilds.get(role.guild.id)
+        if closure is not None:
+            closure.positions[role.id] = role.position
+            self._update_role(role.guild.id, closure, role.id)
+
+    def on_role_update(self, before, after):
+        closure = self._guilds.get(after.guild.id)
+        if closure is not None and before.position != after.position:
+            closure.positions[after.id] = after.position
+            self._update_role(after.guild.id, closure, after.id)
+
+    def on_role_delete(self, role):
+        closure = self._guilds.get(role.guild.id)
+        if closure is not None and closure.positions.pop(role.id, None) is not None:
+            self._update_role(role.guild.id, closure, role.id)
+
+    def _compile(self, guild):
+        closure = self._guilds[guild.id] = _GuildClosure({role.id: role.position for role in guild.roles})
+        for principal_id in self._permissions[guild.id]:
+            if principal_id in closure.positions:
+                self._update_role(guild.id, closure, principal_id)
+        return closure
+
+    def _update_role(self, guild_id, closure, role_id):
+        touched = closure.keys.pop(role_id, set())
+        for key in touched:
+            closure.granting[key].pop(role_id, None)
+
+        position = closure.positions.get(role_id)
+        commands = self._permissions.get(guild_id, {}).get(role_id) if position is not None else None
+        if commands:
+            keys = set()
+            for command, subcommands in commands.items():
+                command = command.lower()
+                keys.add(MASTER if command == "*" else (command, None))
+                keys.update((command, subcommand.lower()) for subcommand in subcommands)
+            for key in keys:
+                closure.granting.setdefault(key, {})[role_id] = position
+            closure.keys[role_id] = keys
+            touched |= keys
+
+        for key in touched:
+            granting = closure.granting.get(key)
+            if granting:
+                closure.minimum[key] = min(granting.values())
+            else:
+                closure.granting.pop(key, None)
+                closure.minimum.pop(key, None)
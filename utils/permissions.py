@@ -1,6 +1,30 @@
+import asyncio
 import discord
-import json
-from config import PERMISSIONS, ROLE_MANAGERS, ROLE_ADMINS, save_permissions  # Import save_permissions
+from config import PERMISSIONS, ROLE_MANAGERS, ROLE_ADMINS, GUILD_SETTINGS, PERMISSION_STORE, PERMISSIONS_INHERIT
+from storage.base import LEGACY_GUILD
+from utils.cluster import cluster_link
+from utils.permission_index import HierarchyClosure, PermissionIndex
+from utils.metrics import metrics
+
+permission_index = PermissionIndex(PERMISSIONS)
+hierarchy_closure = HierarchyClosure(PERMISSIONS)
+
+def invalidate_guild(guild_id=None):
+    """
+    Drop the cached permission state of one guild (or of every guild) so it
+    is read from the store again. Called when another cluster process
+    reports a change.
+    """
+    PERMISSION_STORE.invalidate(guild_id)
+    PERMISSIONS.invalidate(guild_id)
+    ROLE_MANAGERS.invalidate(guild_id)
+    ROLE_ADMINS.invalidate(guild_id)
+    GUILD_SETTINGS.invalidate(guild_id)
+    permission_index.rebuild(guild_id)
+    hierarchy_closure.rebuild(guild_id)
+
+def _changed(guild_id):
+    cluster_link.publish("invalidate", guild=guild_id)
 
 def user_has_permission(interaction: discord.Interaction, allowed_roles, allowed_users) -> bool:
     member = interaction.user
@@ -10,102 +34,182 @@ def user_has_permission(interaction: discord.Interaction, allowed_roles, allowed
         member.id in allowed_users
     )
 
-def add_permission(guild_id, user_or_role_id, command, subcommand=None):
-    guild_id = int(guild_id)  
-    user_or_role_id = int(user_or_role_id)  
+def _refresh(guild_id, principal_id):
+    permission_index.refresh(guild_id, principal_id)
+    hierarchy_closure.refresh(guild_id, principal_id)
+
+def _grant(guild_id, user_or_role_id, command, subcommand=None):
+    principals = PERMISSIONS.setdefault(guild_id, {})
+    commands = principals.setdefault(user_or_role_id, {})
+    changed = command not in commands
+    subcommands = commands.setdefault(command, [])
+    if subcommand and subcommand not in subcommands:
+        subcommands.append(subcommand)
+        changed = True
+    if changed:
+        _refresh(guild_id, user_or_role_id)
+        print(f"Updated PERMISSIONS: {user_or_role_id} in guild {guild_id} now has '{command}' {subcommands or '(command only)'}")
+    return changed
+
+def _revoke(guild_id, user_or_role_id, command, subcommand=None):
+    granted = PERMISSIONS.get(guild_id, {}).get(user_or_role_id, {})
+    if command not in granted:
+        return False
 
-    if guild_id not in PERMISSIONS:
-        PERMISSIONS[guild_id] = {}
-    if user_or_role_id not in PERMISSIONS[guild_id]:
-        PERMISSIONS[guild_id][user_or_role_id] = {}
-    if command not in PERMISSIONS[guild_id][user_or_role_id]:
-        PERMISSIONS[guild_id][user_or_role_id][command] = []
     if subcommand:
-        if subcommand not in PERMISSIONS[guild_id][user_or_role_id][command]:
-            PERMISSIONS[guild_id][user_or_role_id][command].append(subcommand)
+        if subcommand not in granted[command]:
+            return False
+        granted[command].remove(subcommand)
+        if not granted[command]:
+            del granted[command]
+    else:
+        del granted[command]
 
-    save_permissions()
+    if not granted:
+        del PERMISSIONS[guild_id][user_or_role_id]
 
-    print(f"Updated PERMISSIONS after add_permission: {json.dumps(PERMISSIONS, indent=4)}")
+    _refresh(guild_id, user_or_role_id)
+    return True
 
-def has_permission(interaction, command, subcommand=None):
-    guild_id = interaction.guild.id
-    user_id = interaction.user.id
-    role_ids = [role.id for role in interaction.user.roles]
+_APPLY = {
+    "grant": _grant,
+    "revoke": _revoke,
+    "add_role_manager": ROLE_MANAGERS.add,
+    "remove_role_manager": ROLE_MANAGERS.remove,
+    "add_role_admin": ROLE_ADMINS.add,
+    "remove_role_admin": ROLE_ADMINS.remove,
+    "set_setting": GUILD_SETTINGS.set,
+}
 
-    command = command.lower()
-    if subcommand and subcommand.startswith("<@&") and subcommand.endswith(">"):
-        try:
-            subcommand = str(int(subcommand[3:-1]))
-        except ValueError:
-            subcommand = None
-    subcommand = subcommand.lower() if subcommand else None
+_guild_locks = {}
 
-    if guild_id in PERMISSIONS:
-        if user_id in PERMISSIONS[guild_id] and "*" in PERMISSIONS[guild_id][user_id]:
-            return True
+def guild_lock(guild_id):
+    lock = _guild_locks.get(guild_id)
+    if lock is None:
+        lock = _guild_locks[guild_id] = asyncio.Lock()
+    return lock
 
-        for role_id in role_ids:
-            if role_id in PERMISSIONS[guild_id] and "*" in PERMISSIONS[guild_id][role_id]:
-                return True
+class PermissionTransaction:
+    """
+    A set of changes to one guild's grants, role managers, role admins and
+    settings.
 
-        if user_id in PERMISSIONS[guild_id]:
-            user_permissions = PERMISSIONS[guild_id][user_id]
-            if command in user_permissions:
-                if not subcommand or subcommand in [sc.lower() for sc in user_permissions[command]]:
-                    return True
+    Use as `async with permission_transaction(guild_id) as txn:`. The
+    guild's lock is held for the whole block, so reads made inside it stay
+    valid; changes are staged and, when the block exits without an
+    exception, applied to memory and persisted as one unit (see
+    PermissionStore.commit). Guilds are locked independently, so
+    transactions on different guilds run concurrently.
+    """
 
-        for role_id in role_ids:
-            if role_id in PERMISSIONS[guild_id]:
-                role_permissions = PERMISSIONS[guild_id][role_id]
-                if command in role_permissions:
-                    if not subcommand or subcommand in [sc.lower() for sc in role_permissions[command]]:
-                        return True
+    def __init__(self, guild_id):
+        self.guild_id = int(guild_id)
+        self.applied = []
+        self._staged = []
 
-    return False
+    def grant(self, user_or_role_id, command, subcommand=None):
+        self._staged.append(("grant", (int(user_or_role_id), command, subcommand)))
+
+    def revoke(self, user_or_role_id, command, subcommand=None):
+        self._staged.append(("revoke", (int(user_or_role_id), command, subcommand)))
+
+    def add_role_manager(self, role_id, user_id):
+        self._staged.append(("add_role_manager", (role_id, user_id)))
 
-def add_role_manager(role_id, manager_id):
-    if role_id not in ROLE_MANAGERS:
-        ROLE_MANAGERS[role_id] = []
-    if manager_id not in ROLE_MANAGERS[role_id]:
-        ROLE_MANAGERS[role_id].append(manager_id)
+    def remove_role_manager(self, role_id, user_id):
+        self._staged.append(("remove_role_manager", (role_id, user_id)))
 
-    save_permissions()
+    def add_role_admin(self, role_id, user_id):
+        self._staged.append(("add_role_admin", (role_id, user_id)))
 
-    print(f"Updated ROLE_MANAGERS: {json.dumps(ROLE_MANAGERS, indent=4)}")
+    def remove_role_admin(self, role_id, user_id):
+        self._staged.append(("remove_role_admin", (role_id, user_id)))
 
-def add_role_admin(role_id, admin_id):
-    if role_id not in ROLE_ADMINS:
-        ROLE_ADMINS[role_id] = []
-    if admin_id not in ROLE_ADMINS[role_id]:
-        ROLE_ADMINS[role_id].append(admin_id)
+    def set_setting(self, key, value):
+        """Set a GUILD_SETTINGS value; None removes it."""
+        self._staged.append(("set_setting", (key, value)))
 
-    save_permissions()
+    async def __aenter__(self):
+        await guild_lock(self.guild_id).acquire()
+        return self
 
-    print(f"Updated ROLE_ADMINS: {json.dumps(ROLE_ADMINS, indent=4)}")
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self._commit()
+        finally:
+            guild_lock(self.guild_id).release()
+
+    @metrics.timed("permissions.commit")
+    def _commit(self):
+        # No awaits from here on: other coroutines never see a half-applied transaction
+        for op, args in self._staged:
+            if _APPLY[op](self.guild_id, *args):
+                self.applied.append((op, args))
+        self._staged.clear()
+        if self.applied:
+            PERMISSION_STORE.commit(self.guild_id, self.applied)
+            _changed(self.guild_id)
+
+def permission_transaction(guild_id):
+    return PermissionTransaction(guild_id)
 
-def remove_role_manager(role_id, manager_id):
-    if role_id in ROLE_MANAGERS and manager_id in ROLE_MANAGERS[role_id]:
-        ROLE_MANAGERS[role_id].remove(manager_id)
-        if not ROLE_MANAGERS[role_id]:
-            del ROLE_MANAGERS[role_id]
-        save_permissions()
+def split_command(command, subcommand=None):
+    """
+    Split a qualified token such as "role create", which the command
+    autocomplete offers, into command and subcommand. Raises ValueError if a
+    subcommand is also given separately.
+    """
+    if " " not in command:
+        return command, subcommand
+    if subcommand:
+        raise ValueError(f"'{command}' already names a subcommand, leave the subcommand option empty.")
+    command, subcommand = command.split(" ", 1)
+    return command, subcommand
+
+def _normalize(command, subcommand):
+    command = command.lower()
+    if subcommand and subcommand.startswith("<@&") and subcommand.endswith(">"):
+        try:
+            subcommand = str(int(subcommand[3:-1]))
+        except ValueError:
+            subcommand = None
+    return command, subcommand.lower() if subcommand else None
 
-def remove_role_admin(role_id, admin_id):
-    if role_id in ROLE_ADMINS and admin_id in ROLE_ADMINS[role_id]:
-        ROLE_ADMINS[role_id].remove(admin_id)
-        if not ROLE_ADMINS[role_id]:
-            del ROLE_ADMINS[role_id]
-        save_permissions()
+# Timed 1 call in 64: a span per call would add about half again to this check
+@metrics.timed("has_permission", sample_every=64)
+def has_permission(interaction, command, subcommand=None):
+    command, subcommand = _normalize(command, subcommand)
+    principal_ids = [interaction.user.id]
+    principal_ids.extend(role.id for role in interaction.user.roles)
+    if permission_index.check(interaction.guild.id, principal_ids, command, subcommand):
+        return True
+    return PERMISSIONS_INHERIT and hierarchy_closure.check(
+        interaction.guild, interaction.user.top_role.position, command, subcommand
+    )
 
-def is_role_manager(role_id, user_id):
-    return role_id in ROLE_MANAGERS and user_id in ROLE_MANAGERS[role_id]
+def is_role_manager(guild_id, role_id, user_id):
+    return ROLE_MANAGERS.contains(guild_id, role_id, user_id)
 
-def is_role_admin(role_id, user_id):
+def is_role_admin(guild_id, role_id, user_id):
     """
     Check if a user is a RoleAdmin for a specific role.
     """
-    return role_id in ROLE_ADMINS and user_id in ROLE_ADMINS[role_id]
+    return ROLE_ADMINS.contains(guild_id, role_id, user_id)
+
+async def claim_legacy_roles(guild: discord.Guild):
+    """
+    Move role managers/admins recorded before they were scoped per guild
+    (LEGACY_GUILD) into the guild that owns the role.
+    """
+    # LEGACY_GUILD is always locked first, so this cannot deadlock
+    async with permission_transaction(LEGACY_GUILD) as legacy_txn, permission_transaction(guild.id) as txn:
+        for index, kind in ((ROLE_MANAGERS, "role_manager"), (ROLE_ADMINS, "role_admin")):
+            legacy = index.for_guild(LEGACY_GUILD)
+            for role_id in [role_id for role_id in legacy if guild.get_role(role_id)]:
+                for user_id in legacy.members(role_id):
+                    getattr(legacy_txn, f"remove_{kind}")(role_id, user_id)
+                    getattr(txn, f"add_{kind}")(role_id, user_id)
 
 def can_manage_role(interaction: discord.Interaction, role_id: int, action: str = None) -> bool:
     """
@@ -113,11 +217,12 @@ def can_manage_role(interaction: discord.Interaction, role_id: int, action: str
     This includes RoleManager (restricted to their role), RoleAdmin, or explicit permissions.
     """
     user_id = interaction.user.id
+    guild_id = interaction.guild.id
 
-    if is_role_admin(role_id, user_id):
+    if is_role_admin(guild_id, role_id, user_id):
         return True
 
-    if role_id in ROLE_MANAGERS and user_id in ROLE_MANAGERS[role_id]:
+    if is_role_manager(guild_id, role_id, user_id):
         if action in ["assign", "unassign"]:
             return True
         return False
@@ -126,3 +231,110 @@ def can_manage_role(interaction: discord.Interaction, role_id: int, action: str
         return True
 
     return False
+
+WHOHAS_PAGE_SIZE = 20
+
+@metrics.timed("who_has")
+def who_has(guild: discord.Guild, command, subcommand=None):
+    """
+    Everyone who can run `command` (`subcommand`) in the guild, as
+    (principal_id, reason) pairs sorted by reason: "*" holders, direct
+    grants and, when the subcommand is a role ID, that role's admins and
+    managers. Served from the inverted indexes, without scanning the guild.
+    """
+    command, subcommand = _normalize(command, subcommand)
+    guild_id = guild.id
+    found = {}
+    for principal_id in permission_index.masters(guild_id):
+        found.setdefault(principal_id, "master access")
+    for principal_id in permission_index.holders(guild_id, command, subcommand):
+        found.setdefault(principal_id, "grant")
+    if command == "role" and subcommand and subcommand.isdigit():
+        for principal_id in ROLE_ADMINS.members(guild_id, int(subcommand)):
+            found.setdefault(principal_id, "role admin")
+        for principal_id in ROLE_MANAGERS.members(guild_id, int(subcommand)):
+            found.setdefault(principal_id, "role manager (assign/unassign)")
+
+    if PERMISSIONS_INHERIT:
+        for principal_id, reason in found.items():
+            if guild.get_role(principal_id) and not reason.startswith("role "):
+                found[principal_id] = f"{reason}, and every role above it"
+    return sorted(found.items(), key=lambda entry: (entry[1], entry[0]))
+
+def export_holders(guild_id):
+    """
+    The guild's whole inverted index as a JSON-serializable dict: "*"
+    holders, principals per "command" / "command subcommand", and the
+    users per role for role managers and role admins.
+    """
+    grants = {}
+    for (command, subcommand), principals in permission_index.holder_items(guild_id):
+        grants[f"{command} {subcommand}" if subcommand else command] = sorted(principals)
+    return {
+        "guild": guild_id,
+        "master": sorted(permission_index.masters(guild_id)),
+        "grants": dict(sorted(grants.items())),
+        **{
+            kind: {str(role_id): sorted(users) for role_id, users in index.for_guild(guild_id).items()}
+            for kind, index in (("role_managers", ROLE_MANAGERS), ("role_admins", ROLE_ADMINS))
+        },
+    }
+
+def render_who_has(guild: discord.Guild, command, subcommand, entries, page):
+    """One page of the /whohas message, or None if the page is out of range."""
+    pages = max(1, -(-len(entries) // WHOHAS_PAGE_SIZE))
+    if page < 1 or page > pages:
+        return None
+
+    target = f"`{command} {subcommand}`" if subcommand else f"`{command}`"
+    if not entries:
+        return f"Nobody can run {target} here."
+
+    lines = [f"**Who can run {target}** ({len(entries)} total, page {page}/{pages})"]
+    for principal_id, reason in entries[(page - 1) * WHOHAS_PAGE_SIZE:page * WHOHAS_PAGE_SIZE]:
+        role = guild.get_role(principal_id)
+        lines.append(f"- {role.mention if role else f'<@{principal_id}>'}: {reason}")
+    return "\n".join(lines)
+
+def render_permission_report(guild: discord.Guild, member: discord.Member):
+    """
+    Build the /checkperms message for a member, or None if they hold no
+    grants, managed roles or administered roles in this guild.
+    """
+    user_id = member.id
+    role_ids = [role.id for role in member.roles]
+    guild_id = guild.id
+
+    user_perms = {}
+
+    if guild_id in PERMISSIONS:
+        if user_id in PERMISSIONS[guild_id]:
+            user_perms["User"] = PERMISSIONS[guild_id][user_id]
+        for role_id in role_ids:
+            if role_id in PERMISSIONS[guild_id]:
+                user_perms[f"Role {role_id}"] = PERMISSIONS[guild_id][role_id]
+
+    role_manager_roles = [role for role in map(guild.get_role, ROLE_MANAGERS.roles_of(guild_id, user_id)) if role]
+    role_admin_roles = [role for role in map(guild.get_role, ROLE_ADMINS.roles_of(guild_id, user_id)) if role]
+
+    if not user_perms and not role_manager_roles and not role_admin_roles:
+        return None
+
+    lines = ["**Your Permissions**"]
+    if user_perms:
+        lines.append("**General Permissions:**")
+        for key, perms in user_perms.items():
+            lines.append(f"- **{key}:**")
+            for command, subcommands in perms.items():
+                subcommands_list = ", ".join(subcommands) if subcommands else "None"
+                lines.append(f"  - `{command}`: {subcommands_list}")
+
+    if role_manager_roles:
+        lines.append("\n**Role Manager For:**")
+        lines.extend(f"- {role.mention}" for role in role_manager_roles)
+
+    if role_admin_roles:
+        lines.append("\n**Role Admin For:**")
+        lines.extend(f"- {role.mention}" for role in role_admin_roles)
+
+    return "\n".join(lines) + "\n"
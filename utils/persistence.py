@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from utils.metrics import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def read_json(path):
+    """Parse a JSON file, using orjson when it is installed."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def dump_json(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def atomic_write_json(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(dump_json(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class WriteBehind:
+    """
+    Coalesces save requests for a JSON file.
+
+    schedule() marks the state dirty and, when called from the event loop,
+    writes it once after `delay` seconds no matter how many mutations landed
+    in between. The snapshot is taken on the loop so it is consistent; the
+    serialization and the temp file + fsync + rename run in a worker thread.
+    Outside an event loop the write happens immediately.
+    """
+
+    def __init__(self, path, snapshot, delay=1.0):
+        self.path = path
+        self.delay = delay
+        self._snapshot = snapshot
+        self._handle = None
+        self._dirty = False
+        self._seq = 0
+        self._written_seq = 0
+        self._lock = threading.Lock()
+        self._tasks = set()
+
+    def schedule(self):
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+
+        if self._handle is None:
+            self._handle = loop.call_later(self.delay, self._start_write, loop)
+
+    def _start_write(self, loop):
+        self._handle = None
+        seq, data = self._take_snapshot()
+        task = loop.create_task(self._write_in_thread(seq, data))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write_in_thread(self, seq, data):
+        with metrics.span("permissions.write"):
+            await asyncio.to_thread(self._write, seq, data)
+
+    def _take_snapshot(self):
+        self._dirty = False
+        self._seq += 1
+        return self._seq, self._snapshot()
+
+    def _write(self, seq, data):
+        with self._lock:
+            if seq <= self._written_seq:
+                return
+            try:
+                atomic_write_json(self.path, data)
+            except OSError as e:
+                print(f"Failed to write {self.path}: {e}")
+                self._dirty = True
+                return
+            self._written_seq = seq
+
+    def pending(self):
+        return self._dirty
+
+    def _cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def flush(self):
+        """Write any pending state now, on the calling thread (use at shutdown)."""
+        self._cancel()
+        if self._dirty:
+            self._write(*self._take_snapshot())
+
+    async def aflush(self):
+        self._cancel()
+        if self._dirty:
+            await asyncio.to_thread(self._write, *self._take_snapshot())
@@ -0,0 +1,58 @@
+class RoleIndex:
+    """
+    Bidirectional role <-> user mapping for one guild's role managers or role admins.
+
+    Both directions are kept as sets and updated together, so membership
+    checks are O(1) and listing the roles a user holds costs O(those roles)
+    rather than a scan of every role.
+    """
+
+    def __init__(self, entries=None):
+        self._members = {}
+        self._roles = {}
+        for role_id, user_ids in (entries or {}).items():
+            for user_id in user_ids:
+                self.add(role_id, user_id)
+
+    def add(self, role_id, user_id):
+        members = self._members.setdefault(role_id, set())
+        if user_id in members:
+            return False
+        members.add(user_id)
+        self._roles.setdefault(user_id, set()).add(role_id)
+        return True
+
+    def remove(self, role_id, user_id):
+        members = self._members.get(role_id)
+        if not members or user_id not in members:
+            return False
+        members.remove(user_id)
+        if not members:
+            del self._members[role_id]
+        roles = self._roles[user_id]
+        roles.remove(role_id)
+        if not roles:
+            del self._roles[user_id]
+        return True
+
+    def contains(self, role_id, user_id):
+        members = self._members.get(role_id)
+        return members is not None and user_id in members
+
+    def members(self, role_id):
+        return frozenset(self._members.get(role_id, ()))
+
+    def roles_of(self, user_id):
+        return frozenset(self._roles.get(user_id, ()))
+
+    def items(self):
+        return self._members.items()
+
+    def __contains__(self, role_id):
+        return role_id in self._members
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __len__(self):
+        return len(self._members)
@@ -0,0 +1,30 @@
+def plan_role_positions(roles, block, anchor):
+    """
+    Compute the positions needed to place `block` (a list of roles, top to
+    bottom) directly under `anchor`.
+
+    `roles` is the guild's current role list; roles in `block` may be
+    missing from it (freshly created roles are not cached yet). Only roles
+    whose position actually changes are returned, as a {role: position}
+    mapping ready for Guild.edit_role_positions. @everyone stays at 0.
+    """
+    block_ids = {role.id for role in block}
+    order = sorted(
+        (role for role in roles if role.id not in block_ids),
+        key=lambda role: (role.position, role.id)
+    )
+
+    index = next((i for i, role in enumerate(order) if role.id == anchor.id), None)
+    if index is None:
+        raise ValueError(f"Role '{anchor.name}' is not in this guild")
+    if index == 0:
+        raise ValueError("Roles cannot be placed under @everyone")
+
+    # Positions ascend from the bottom, so the top of the block is inserted last
+    order[index:index] = list(reversed(block))
+
+    return {
+        role: position
+        for position, role in enumerate(order)
+        if role.position != position
+    }
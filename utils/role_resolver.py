@@ -0,0 +1,174 @@
+QUOTES = {'"': '"', "“": "”"}
+
+
+class UnresolvedRole:
+    """A role argument that did not resolve to exactly one role."""
+
+    NOT_FOUND = "not found"
+    AMBIGUOUS = "ambiguous"
+    UNCLOSED_QUOTE = "unclosed quote"
+
+    __slots__ = ("token", "reason", "matches")
+
+    def __init__(self, token, reason, matches=()):
+        self.token = token
+        self.reason = reason
+        self.matches = list(matches)
+
+    def __str__(self):
+        if self.reason == self.AMBIGUOUS:
+            return f"❌ '{self.token}' ({len(self.matches)} roles match, use a mention or ID)"
+        return f"❌ '{self.token}' ({self.reason})"
+
+    def __repr__(self):
+        return f"<UnresolvedRole token={self.token!r} reason={self.reason!r}>"
+
+
+def split_role_list(text):
+    """
+    Split a comma-separated role argument in one pass. Double quotes
+    (straight or curly) keep commas inside a name. Returns (tokens, errors);
+    empty entries are dropped.
+    """
+    tokens = []
+    errors = []
+    current = []
+    closing = None
+    for char in text:
+        if closing is not None:
+            if char == closing:
+                closing = None
+            else:
+                current.append(char)
+        elif char in QUOTES:
+            closing = QUOTES[char]
+        elif char == ",":
+            tokens.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    token = "".join(current).strip()
+    if closing is not None:
+        errors.append(UnresolvedRole(token, UnresolvedRole.UNCLOSED_QUOTE))
+    else:
+        tokens.append(token)
+    return [token for token in tokens if token], errors
+
+
+def _role_id(token):
+    if token.startswith("<@&") and token.endswith(">"):
+        token = token[3:-1]
+    return int(token) if token.isdigit() else None
+
+
+class GuildRoleNames:
+    """
+    Lowercased role name -> ids of the roles with that name, for one guild.
+    Roles themselves are looked up by id through the guild, so the map never
+    holds a stale Role object.
+    """
+
+    def __init__(self, roles=()):
+        self._names = {}
+        self._ids = {}
+        for role in roles:
+            self.add(role)
+
+    def add(self, role):
+        if role.id in self._ids:
+            self.remove(role.id)
+        key = role.name.lower()
+        self._ids[role.id] = key
+        self._names.setdefault(key, []).append(role.id)
+
+    def remove(self, role_id):
+        key = self._ids.pop(role_id, None)
+        if key is None:
+            return
+        ids = self._names[key]
+        ids.remove(role_id)
+        if not ids:
+            del self._names[key]
+
+    def lookup(self, name):
+        return self._names.get(name.lower(), ())
+
+
+class RoleResolver:
+    """
+    Resolves role arguments (mentions, IDs, case-insensitive or quoted
+    names) against per-guild GuildRoleNames maps kept current by the role
+    gateway events, so a list of K roles costs O(K) lookups. Maps are
+    dropped when a guild becomes available again, since role events can be
+    missed while disconnected.
+    """
+
+    def __init__(self):
+        self._guilds = {}
+
+    def for_guild(self, guild):
+        names = self._guilds.get(guild.id)
+        if names is None:
+            names = self._guilds[guild.id] = GuildRoleNames(guild.roles)
+        return names
+
+    def resolve(self, guild, text):
+        """Resolve a comma-separated argument to (roles, errors); roles are unique and in argument order."""
+        tokens, errors = split_role_list(text)
+        roles = {}
+        for token in tokens:
+            result = self.resolve_one(guild, token)
+            if isinstance(result, UnresolvedRole):
+                errors.append(result)
+            else:
+                roles.setdefault(result.id, result)
+        return list(roles.values()), errors
+
+    def resolve_one(self, guild, token):
+        """The role `token` names, or an UnresolvedRole saying why there is none."""
+        role_id = _role_id(token)
+        if role_id is not None:
+            role = guild.get_role(role_id)
+            if role is not None or token.startswith("<@&"):
+                return role or UnresolvedRole(token, UnresolvedRole.NOT_FOUND)
+            # A number that is not a role ID may still be a role name
+
+        matches = self._matches(guild, token)
+        if not matches:
+            return UnresolvedRole(token, UnresolvedRole.NOT_FOUND)
+        if len(matches) > 1:
+            # An exact-case match wins over names that differ only in case
+            exact = [role for role in matches if role.name == token]
+            if len(exact) != 1:
+                return UnresolvedRole(token, UnresolvedRole.AMBIGUOUS, exact or matches)
+            return exact[0]
+        return matches[0]
+
+    def _matches(self, guild, token):
+        roles = [guild.get_role(role_id) for role_id in self.for_guild(guild).lookup(token)]
+        if any(role is None or role.name.lower() != token.lower() for role in roles):
+            # A role was deleted or renamed without its event reaching us; rebuild this guild
+            self._guilds[guild.id] = GuildRoleNames(guild.roles)
+            roles = [guild.get_role(role_id) for role_id in self._guilds[guild.id].lookup(token)]
+        return roles
+
+    def on_role_create(self, role):
+        names = self._guilds.get(role.guild.id)
+        if names is not None:
+            names.add(role)
+
+    def on_role_update(self, before, after):
+        names = self._guilds.get(after.guild.id)
+        if names is not None and before.name != after.name:
+            names.add(after)
+
+    def on_role_delete(self, role):
+        names = self._guilds.get(role.guild.id)
+        if names is not None:
+            names.remove(role.id)
+
+    def forget_guild(self, guild_id):
+        self._guilds.pop(guild_id, None)
+
+
+role_resolver = RoleResolver()
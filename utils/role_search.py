@@ -0,0 +1,176 @@
+import heapq
+import itertools
+from discord import app_commands
+
+MAX_NGRAM = 3
+MAX_RESULTS = 25
+
+_clock = itertools.count(1)
+
+
+def _ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class _TrieNode:
+    __slots__ = ("children", "role_ids")
+
+    def __init__(self):
+        self.children = {}
+        self.role_ids = set()
+
+
+class GuildRoleIndex:
+    """
+    Search index over one guild's role names.
+
+    Lowercased names are inserted into a prefix trie at every word start
+    (each node holds the ids of all roles below it) and into 1..3-gram
+    posting sets for substring matches that are not word prefixes.
+    """
+
+    def __init__(self, roles=()):
+        self._roles = {}
+        self._trie = _TrieNode()
+        self._grams = {}
+        self._recency = {}
+        for role in roles:
+            self.add(role)
+
+    def add(self, role):
+        if role.id in self._roles:
+            self.remove(role.id)
+        name = role.name.lower()
+        self._roles[role.id] = (name, app_commands.Choice(name=role.name, value=role.name))
+        self._recency[role.id] = next(_clock)
+
+        for start in self._word_starts(name):
+            node = self._trie
+            for char in name[start:]:
+                node = node.children.setdefault(char, _TrieNode())
+                node.role_ids.add(role.id)
+
+        for n in range(1, MAX_NGRAM + 1):
+            for gram in _ngrams(name, n):
+                self._grams.setdefault(gram, set()).add(role.id)
+
+    def remove(self, role_id):
+        entry = self._roles.pop(role_id, None)
+        if entry is None:
+            return
+        name = entry[0]
+        self._recency.pop(role_id, None)
+
+        for start in self._word_starts(name):
+            node = self._trie
+            for char in name[start:]:
+                child = node.children.get(char)
+                if child is None:
+                    break
+                child.role_ids.discard(role_id)
+                if not child.role_ids:
+                    del node.children[char]
+                    break
+                node = child
+
+        for n in range(1, MAX_NGRAM + 1):
+            for gram in _ngrams(name, n):
+                ids = self._grams.get(gram)
+                if ids is not None:
+                    ids.discard(role_id)
+                    if not ids:
+                        del self._grams[gram]
+
+    def touch(self, role_id):
+        if role_id in self._roles:
+            self._recency[role_id] = next(_clock)
+
+    @staticmethod
+    def _word_starts(name):
+        return [i for i, char in enumerate(name) if char != " " and (i == 0 or name[i - 1] in " -_")]
+
+    def _prefixed(self, query):
+        node = self._trie
+        for char in query:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.role_ids
+
+    def _substring(self, query):
+        gram_size = min(len(query), MAX_NGRAM)
+        postings = sorted(
+            (self._grams.get(gram, set()) for gram in _ngrams(query, gram_size)),
+            key=len
+        )
+        if not postings or not postings[0]:
+            return set()
+        return set.intersection(*postings)
+
+    def search(self, query, limit=MAX_RESULTS):
+        query = query.lower()
+        if not query:
+            role_ids = heapq.nlargest(limit, self._roles, key=self._recency.__getitem__)
+            return [self._roles[role_id][1] for role_id in role_ids]
+
+        # Word-prefix matches always outrank plain substring matches, so the
+        # n-gram lookup is only needed when the trie cannot fill the page.
+        prefixed = self._prefixed(query)
+        candidates = prefixed if len(prefixed) >= limit else prefixed | self._substring(query)
+
+        ranked = []
+        for role_id in candidates:
+            name, choice = self._roles[role_id]
+            if role_id in prefixed:
+                position = next(i for i in self._word_starts(name) if name.startswith(query, i))
+                tier = 0 if position == 0 else 1
+            else:
+                position = name.find(query)
+                if position < 0:
+                    continue
+                tier = 2
+            ranked.append(((tier, position, -self._recency[role_id], name), choice))
+
+        return [choice for _, choice in heapq.nsmallest(limit, ranked, key=lambda item: item[0])]
+
+
+class RoleSearch:
+    """Per-guild GuildRoleIndex registry, kept current by the role gateway events."""
+
+    def __init__(self):
+        self._guilds = {}
+
+    def for_guild(self, guild):
+        index = self._guilds.get(guild.id)
+        if index is None:
+            index = self._guilds[guild.id] = GuildRoleIndex(guild.roles)
+        return index
+
+    def search(self, guild, query, limit=MAX_RESULTS):
+        return self.for_guild(guild).search(query, limit)
+
+    def touch(self, guild, role_id):
+        index = self._guilds.get(guild.id)
+        if index is not None:
+            index.touch(role_id)
+
+    def on_role_create(self, role):
+        index = self._guilds.get(role.guild.id)
+        if index is not None:
+            index.add(role)
+
+    def on_role_update(self, before, after):
+        index = self._guilds.get(after.guild.id)
+        if index is not None and before.name != after.name:
+            index.add(after)
+
+    def on_role_delete(self, role):
+        index = self._guilds.get(role.guild.id)
+        if index is not None:
+            index.remove(role.id)
+
+    def forget_guild(self, guild_id):
+        self._guilds.pop(guild_id, None)
+
+
+role_search = RoleSearch()
@@ -0,0 +1,140 @@
+import asyncio
+import heapq
+import itertools
+import time
+from config import SCHEDULER_MAX_IN_FLIGHT, SCHEDULER_BUCKET_IN_FLIGHT
+from utils.metrics import metrics
+
+# Priority classes, most urgent first
+INTERACTION, ROLE_MUTATION, LOGGING = 0, 1, 2
+PRIORITY_NAMES = {INTERACTION: "interaction", ROLE_MUTATION: "role_mutation", LOGGING: "logging"}
+
+
+class _Bucket:
+    __slots__ = ("semaphore", "users")
+
+    def __init__(self, size):
+        self.semaphore = asyncio.Semaphore(size)
+        self.users = 0
+
+
+class RequestScheduler:
+    """
+    Orders the bot's outbound Discord API requests by priority class:
+    interaction responses, then role mutations (and other REST calls made by
+    commands), then audit logging.
+
+    install() wraps discord.py's two request paths: the bot's HTTPClient and
+    the webhook adapter used for interaction responses, followups and the
+    log webhooks. Each request first takes a slot in its rate limit bucket
+    (route plus major parameters, at most bucket_in_flight at once), so a
+    saturated bucket queues on its own instead of holding global slots.
+    It then waits until the number of requests in flight is under its
+    class's limit (none for interactions, max_in_flight for role mutations,
+    half of it for logging); freed slots go to the most urgent waiter. discord.py
+    still enforces the actual X-RateLimit budgets inside each request.
+    """
+
+    def __init__(self, max_in_flight=SCHEDULER_MAX_IN_FLIGHT, bucket_in_flight=SCHEDULER_BUCKET_IN_FLIGHT):
+        self.limits = {INTERACTION: None, ROLE_MUTATION: max_in_flight, LOGGING: max(1, max_in_flight // 2)}
+        self.bucket_in_flight = bucket_in_flight
+        self.in_flight = 0
+        self._waiters = []
+        self._counter = itertools.count()
+        self._buckets = {}
+        self._application_id = None
+        for priority, name in PRIORITY_NAMES.items():
+            metrics.gauge("scheduler_queue_depth", lambda priority=priority: self.queue_depth(priority), priority=name)
+        metrics.gauge("scheduler_in_flight", lambda: self.in_flight)
+
+    def install(self, client):
+        """Route `client`'s REST requests and all webhook requests through the scheduler."""
+        from discord.webhook.async_ import async_context
+
+        self._application_id = lambda: client.application_id
+        client.http.request = self._wrap(client.http.request)
+        adapter = async_context.get()
+        adapter.request = self._wrap(adapter.request)
+
+    def classify(self, route):
+        path = route.path
+        if path.startswith("/interactions/"):
+            return INTERACTION
+        if path.startswith("/webhooks/{webhook_id}/{webhook_token}"):
+            # Followups are sent to the application's own webhook; anything else is a log webhook
+            application_id = self._application_id() if self._application_id else None
+            return INTERACTION if str(route.webhook_id) == str(application_id) else LOGGING
+        if "/webhooks" in path or (route.method == "POST" and path == "/channels/{channel_id}/messages"):
+            # The bot only posts channel messages and manages webhooks for the audit log
+            return LOGGING
+        return ROLE_MUTATION
+
+    def queue_depth(self, priority):
+        return sum(1 for waiter in self._waiters if waiter[0] == priority and not waiter[2].done())
+
+    def _wrap(self, request):
+        async def scheduled(route, *args, **kwargs):
+            return await self.run(route, request, route, *args, **kwargs)
+        scheduled.__wrapped__ = request
+        return scheduled
+
+    async def run(self, route, func, *args, **kwargs):
+        priority = self.classify(route)
+        key = f"{route.key}:{route.major_parameters}"
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self.bucket_in_flight)
+        bucket.users += 1
+
+        started = time.perf_counter()
+        try:
+            async with bucket.semaphore:
+                await self._acquire(priority)
+                metrics.observe("scheduler_wait_seconds", time.perf_counter() - started, priority=PRIORITY_NAMES[priority])
+                metrics.inc("scheduler_requests_total", priority=PRIORITY_NAMES[priority])
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self._release()
+        finally:
+            bucket.users -= 1
+            if not bucket.users:
+                del self._buckets[key]
+
+    def _has_room(self, priority):
+        limit = self.limits[priority]
+        return limit is None or self.in_flight < limit
+
+    async def _acquire(self, priority):
+        if self._has_room(priority) and not any(
+            waiter[0] <= priority and not waiter[2].done() for waiter in self._waiters
+        ):
+            self.in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation
+                self._release()
+            raise
+
+    def _release(self):
+        self.in_flight -= 1
+        # Hand freed slots to the most urgent waiters whose class still has room
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._has_room(priority):
+                break
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            future.set_result(None)
+
+
+request_scheduler = RequestScheduler()